@@ -0,0 +1,108 @@
+import logging
+import sqlite3
+import time
+
+opposite_actions = {
+    'reblog': 'unreblog',
+    'unreblog': 'reblog',
+    'follow': 'unfollow',
+    'unfollow': 'follow',
+}
+
+
+class ActionQueue:
+    def __init__(self, logger, path):
+        self.logger = logger  # type: logging.Logger
+        self.path = path
+
+        self.db = None  # type: sqlite3.Connection | None
+        self.user_counts = {}  # (user_uri, action) -> queued actions, read for every boost decision
+
+    def open(self):
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        # commits without an fsync each: a crash of the process loses nothing, a power loss the last ones at most
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS actions (
+                action TEXT NOT NULL,
+                target TEXT NOT NULL,
+                user_uri TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_time REAL NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (action, target)
+            );
+            CREATE INDEX IF NOT EXISTS actions_next_time ON actions (next_time);
+            CREATE INDEX IF NOT EXISTS actions_user ON actions (user_uri, action);
+        ''')
+
+        self.user_counts = {}
+        for user_uri, action, count in self.db.execute('SELECT user_uri, action, COUNT(*) FROM actions '
+                                                       'WHERE user_uri IS NOT NULL GROUP BY user_uri, action'):
+            self.user_counts[(user_uri, action)] = count
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def push(self, action, target, user_uri=None, priority=0):
+        # type: (str, str, str | None, int) -> bool
+        now = time.time()
+        removed_uri = None
+        with self.db:
+            opposite = opposite_actions.get(action)
+            if opposite:
+                # a pending follow then unfollow of the same account cancel each other out
+                removed_uri = self.delete(opposite, target)
+
+            c = self.db.execute('INSERT OR IGNORE INTO actions (action, target, user_uri, priority, next_time, created) '
+                                'VALUES (?, ?, ?, ?, ?, ?)',
+                                (action, str(target), user_uri, priority, now, now))
+
+        if removed_uri:
+            self.add_user_count(removed_uri, opposite, -1)
+        if c.rowcount > 0 and user_uri:
+            self.add_user_count(user_uri, action, 1)
+        return c.rowcount > 0
+
+    def remove(self, action, target):
+        with self.db:
+            removed_uri = self.delete(action, target)
+        if removed_uri:
+            self.add_user_count(removed_uri, action, -1)
+
+    def delete(self, action, target):
+        # returns the user of the deleted action, if any
+        row = self.db.execute('SELECT user_uri FROM actions WHERE action = ? AND target = ?',
+                              (action, str(target))).fetchone()
+        if row is None:
+            return None
+        self.db.execute('DELETE FROM actions WHERE action = ? AND target = ?', (action, str(target)))
+        return row[0]
+
+    def add_user_count(self, user_uri, action, amount):
+        key = (user_uri, action)
+        count = self.user_counts.get(key, 0) + amount
+        if count > 0:
+            self.user_counts[key] = count
+        else:
+            self.user_counts.pop(key, None)
+
+    def retry_later(self, action, target, delay):
+        with self.db:
+            self.db.execute('UPDATE actions SET attempts = attempts + 1, next_time = ? WHERE action = ? AND target = ?',
+                            (time.time() + delay, action, str(target)))
+
+    def get_due(self, limit):
+        # type: (int) -> list[tuple[str, str, str | None, int, int]]
+        return self.db.execute('SELECT action, target, user_uri, priority, attempts FROM actions WHERE next_time <= ? '
+                               'ORDER BY priority, created LIMIT ?', (time.time(), limit)).fetchall()
+
+    def count_user(self, action, user_uri):
+        return self.user_counts.get((user_uri, action), 0)
+
+    def count(self):
+        return self.db.execute('SELECT COUNT(*) FROM actions').fetchone()[0]
@@ -1,9 +1,21 @@
+import connpool
+import contextlib
 import datetime
+import gzip
 import http.client
 import json
+import jsondecode
 import logging
+import metrics
+import ratelimit
+import re
+import recording
+import threading
+import time
 import urllib.parse
 
+re_path_id = re.compile(r'/\d+(?=/|$)')
+
 
 class StatusException(Exception):
     def get_status_code(self):
@@ -21,46 +33,77 @@ class UnexpectedResponseException(Exception):
 
 
 class ApiClient:
-    def __init__(self, logger, base_url, api_key, persistent=None):
+    def __init__(self, logger, base_url, api_key, persistent=None, scheduler=None, pool=None, project=False, name=None,
+                 recorder=None):
         self.logger = logger  # type: logging.Logger
         self.base_url = base_url
         self.api_key = api_key
         self.persistent = persistent
+        self.scheduler = scheduler  # type: ratelimit.RateLimitScheduler | None
+        self.pool = pool
+        self.project = project
+        self.name = name or logger.name
+        self.recorder = recorder  # type: recording.Recorder | None
 
-        self.conn = None
+        self.local = threading.local()
         self.rate_limit_remaining = None
         self.rate_limit_reset_date = None
+        self.request_count = 0  # sent requests, cycle budgets count theirs from it
+
+    def create_conn(self, base_url=None, timeout=None):
+        return connpool.create_conn(base_url or self.base_url, timeout)
 
-    def create_conn(self):
-        o = urllib.parse.urlparse(self.base_url)
-        c = http.client.HTTPSConnection(o.netloc)
-        return c
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = connpool.get_pool(self.base_url)
+        return self.pool
 
-    def get_conn(self):
-        if self.conn is None:
-            self.conn = self.create_conn()
-        return self.conn
+    def get_priority(self):
+        return getattr(self.local, 'priority', ratelimit.PRIORITY_HIGH)
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        previous = self.get_priority()
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
 
     def get_home_timeline(self, params=None):
         path = '/api/v1/timelines/home'
         r, data = self.request('GET', path, params)
         self.check_response_status(r, data)
-        return self.get_check_response_json_list(r, data)
+        return self.project_statuses(self.get_check_response_json_list(r, data))
+
+    def get_home_timeline_page(self, params=None):
+        path = '/api/v1/timelines/home'
+        r, data = self.request('GET', path, params)
+        self.check_response_status(r, data)
+        statuses = self.project_statuses(self.get_check_response_json_list(r, data))
+        return statuses, parse_link_header(r.getheader('link'))
 
     def get_status(self, status_id):
         path = f'/api/v1/statuses/{int(status_id)}'
         r, data = self.request('GET', path)
         self.check_response_status(r, data)
-        return self.get_check_response_json_dict(r, data)
+        return self.project_status(self.get_check_response_json_dict(r, data))
+
+    def get_statuses(self, status_ids):
+        path = '/api/v1/statuses'
+        query = [('id[]', int(status_id)) for status_id in status_ids]
+        r, data = self.request('GET', path, query)
+        self.check_response_status(r, data)
+        return self.project_statuses(self.get_check_response_json_list(r, data))
 
     def reblog_status(self, status_id):
         path = f'/api/v1/statuses/{int(status_id)}/reblog'
-        r, data = self.request('POST', path)
+        r, data = self.request('POST', path, idempotent=True)
         self.check_response_status(r, data)
 
     def unreblog_status(self, status_id):
         path = f'/api/v1/statuses/{int(status_id)}/unreblog'
-        r, data = self.request('POST', path)
+        r, data = self.request('POST', path, idempotent=True)
         self.check_response_status(r, data)
 
     def delete_status(self, status_id):
@@ -72,23 +115,68 @@ class ApiClient:
         path = '/api/v1/notifications'
         r, data = self.request('GET', path, params)
         self.check_response_status(r, data)
-        return self.get_check_response_json_list(r, data)
+        return self.project_notifications(self.get_check_response_json_list(r, data))
+
+    def get_notifications_page(self, params=None):
+        path = '/api/v1/notifications'
+        r, data = self.request('GET', path, params)
+        self.check_response_status(r, data)
+        notifications = self.project_notifications(self.get_check_response_json_list(r, data))
+        return notifications, parse_link_header(r.getheader('link'))
 
     def dismiss_notification(self, notification_id):
         path = f'/api/v1/notifications/{int(notification_id)}/dismiss'
-        r, data = self.request('POST', path)
+        r, data = self.request('POST', path, idempotent=True)
         self.check_response_status(r, data)
 
     def follow_account(self, account_id):
         path = f'/api/v1/accounts/{int(account_id)}/follow'
-        r, data = self.request('POST', path)
+        r, data = self.request('POST', path, idempotent=True)
         self.check_response_status(r, data)
 
     def unfollow_account(self, account_id):
         path = f'/api/v1/accounts/{int(account_id)}/unfollow'
-        r, data = self.request('POST', path)
+        r, data = self.request('POST', path, idempotent=True)
+        self.check_response_status(r, data)
+
+    def verify_credentials(self):
+        path = '/api/v1/accounts/verify_credentials'
+        r, data = self.request('GET', path)
+        self.check_response_status(r, data)
+        return self.get_check_response_json_dict(r, data)
+
+    def get_following_page(self, account_id, params=None):
+        path = f'/api/v1/accounts/{int(account_id)}/following'
+        r, data = self.request('GET', path, params)
         self.check_response_status(r, data)
+        return self.get_check_response_json_list(r, data), parse_link_header(r.getheader('link'))
 
+    def get_relationships(self, account_ids):
+        path = '/api/v1/accounts/relationships'
+        query = [('id[]', int(account_id)) for account_id in account_ids]
+        r, data = self.request('GET', path, query)
+        self.check_response_status(r, data)
+        return self.get_check_response_json_list(r, data)
+
+    def open_user_stream(self, base_url=None, timeout=None):
+        # uses its own connection: the stream stays open while regular requests go on
+        path = '/api/v1/streaming/user'
+        headers = {'Authorization': 'Bearer ' + self.api_key, 'Accept': 'text/event-stream'}
+
+        self.logger.debug(f'STREAM GET {path}')
+
+        c = self.create_conn(base_url, timeout)
+        try:
+            c.request('GET', path, None, headers)
+            r = c.getresponse()
+            self.logger.debug(f'STREAM RESPONSE "{r.reason}" ({r.status})')
+            if r.status != 200:
+                self.check_response_status(r, r.read())
+        except Exception:
+            c.close()
+            raise
+
+        return c, r
 
     def check_response_status(self, response, data_bytes):
         if response.status != 200:
@@ -96,34 +184,44 @@ class ApiClient:
 
     def get_check_response_json(self, response, data_bytes):
         ct = response.getheader('content-type')  # type: str
-        if not ct or ct.lower().find('application/json') == -1 or ct.lower().find('utf-8') == -1:
+        lct = ct.lower() if ct else ''
+        if lct.find('application/json') == -1 or lct.find('utf-8') == -1:
             raise UnexpectedResponseException(f'Unexpected content-type ({ct})')
 
         if type(data_bytes) != bytes or len(data_bytes) == 0:
             raise UnexpectedResponseException(f'Empty response data')
 
         try:
-            content = str(data_bytes, 'utf-8')
-        except UnicodeDecodeError as e:
-            raise UnexpectedResponseException(f'Invalid utf-8 response', data_bytes) from e
-
-        try:
-            data = json.loads(content)
-        except json.decoder.JSONDecodeError as e:
-            raise UnexpectedResponseException(f'Failed to decode json response', content) from e
+            data = jsondecode.loads(data_bytes)
+        except jsondecode.DecodeError as e:
+            raise UnexpectedResponseException(f'Failed to decode json response', data_bytes) from e
 
         return data
 
     def get_response_json_safe(self, data_bytes):
         if type(data_bytes) == bytes and data_bytes != b'':
             try:
-                content = str(data_bytes, 'utf-8')
-                return json.loads(content)
+                return jsondecode.loads(data_bytes)
             except Exception:
                 pass
 
         return None
 
+    def project_status(self, status):
+        if self.project:
+            return jsondecode.project_status(status)
+        return status
+
+    def project_statuses(self, statuses):
+        if self.project:
+            return [jsondecode.project_status(status) for status in statuses]
+        return statuses
+
+    def project_notifications(self, notifications):
+        if self.project:
+            return [jsondecode.project_notification(n) for n in notifications]
+        return notifications
+
     def get_check_response_json_dict(self, response, data_bytes):
         data = self.get_check_response_json(response, data_bytes)
         if type(data) != dict:
@@ -138,41 +236,77 @@ class ApiClient:
 
         return data
 
-    def request(self, method, path, query=None, body=None, headers=None):
+    def request(self, method, path, query=None, body=None, headers=None, idempotent=None):
+        if idempotent is None:
+            idempotent = method in connpool.idempotent_methods
+
         final_path = path
         if query is not None:
             final_path += '?' + urllib.parse.urlencode(query)
 
-        final_headers = {'Authorization': 'Bearer ' + self.api_key}
+        final_headers = {'Authorization': 'Bearer ' + self.api_key, 'Accept-Encoding': 'gzip'}
         if headers is not None:
             final_headers.update(headers)
 
         json_body = None
         if body is not None:
             json_body = json.dumps(body)
-            headers['Content-Type'] = 'application/json'
+            final_headers['Content-Type'] = 'application/json'
+
+        if self.scheduler is not None and not self.scheduler.acquire(self.get_priority()):
+            raise ratelimit.RateLimitException(f'Rate limit reached, request {method} {path} not sent')
+        self.request_count += 1
 
         self.logger.debug(f'REQUEST {method} {final_path}')
         # self.logger.debug(f'{final_headers}')
 
-        c = None
-        try:
-            c = self.get_conn()
-            c.request(method, final_path, json_body, final_headers)
-            r = c.getresponse()
-            self.logger.debug(f'RESPONSE "{r.reason}" ({r.status})')
-
-            data = r.read()
-
-            # self.logger.debug(f'headers: {r.getheaders()}')
-            # self.logger.debug(f'body: "{data}"')
+        endpoint = get_endpoint_name(path)
+        start_time = time.perf_counter()
 
-            self.handle_rate_limit(r)
-
-            return r, data
-        finally:
-            if not self.persistent and c is not None:
-                c.close()
+        pool = self.get_pool()
+        while True:
+            c, reused = pool.get()
+            try:
+                c.request(method, final_path, json_body, final_headers)
+                r = c.getresponse()
+                data = r.read()
+            except connpool.stale_connection_errors as e:
+                pool.discard(c)
+                # the server may have closed an idle keep-alive connection, safe to send again once
+                if reused and idempotent:
+                    self.logger.debug(f'Stale connection ({e!r}), retrying')
+                    continue
+                metrics.api_responses.inc(bot=self.name, endpoint=endpoint, status='error')
+                raise
+            except BaseException:
+                pool.discard(c)
+                metrics.api_responses.inc(bot=self.name, endpoint=endpoint, status='error')
+                raise
+            break
+
+        duration = time.perf_counter() - start_time
+        metrics.api_request_duration.observe(duration, bot=self.name, method=method, endpoint=endpoint)
+        metrics.api_responses.inc(bot=self.name, endpoint=endpoint, status=r.status)
+
+        if self.persistent and not r.will_close:
+            pool.put(c)
+        else:
+            c.close()
+
+        self.logger.debug(f'RESPONSE "{r.reason}" ({r.status})')
+
+        if r.getheader('content-encoding', '').lower() == 'gzip':
+            data = gzip.decompress(data)
+
+        if self.recorder is not None:
+            self.recorder.record(self.name, method, path, query, r, data, duration)
+
+        # self.logger.debug(f'headers: {r.getheaders()}')
+        # self.logger.debug(f'body: "{data}"')
+
+        self.handle_rate_limit(r)
+
+        return r, data
 
     def handle_rate_limit(self, response):
         # type: (http.client.HTTPResponse) -> None
@@ -188,10 +322,16 @@ class ApiClient:
                 self.logger.warning(f'API RATE LIMIT ALERT ({remaining}/{limit} - {reset}')
 
             self.rate_limit_remaining = remaining
+            metrics.rate_limit_remaining.set(remaining, bot=self.name)
 
         if reset:
             self.rate_limit_reset_date = get_rate_limit_date(reset)
 
+        if self.scheduler is not None:
+            self.scheduler.update(limit, remaining, get_rate_limit_date(reset))
+
+    def get_request_count(self):
+        return self.request_count
 
     def get_rate_limit_remaining(self):
         return self.rate_limit_remaining
@@ -209,6 +349,30 @@ def get_value_int(value):
     return None
 
 
+def get_endpoint_name(path):
+    # '/api/v1/statuses/123/reblog' -> '/api/v1/statuses/:id/reblog', keeps label cardinality bounded
+    return re_path_id.sub('/:id', path)
+
+
+def parse_link_header(value):
+    # type: (str | None) -> dict[str, dict[str, str]]
+    # '<https://host/api/v1/notifications?max_id=1>; rel="next", <...>; rel="prev"' -> {'next': {'max_id': '1'}, ...}
+    links = {}
+    if value:
+        for part in value.split(','):
+            url, _, params = part.partition(';')
+            url = url.strip().strip('<>')
+            rel = None
+            for param in params.split(';'):
+                key, _, v = param.strip().partition('=')
+                if key == 'rel':
+                    rel = v.strip('"')
+            if rel:
+                query = urllib.parse.urlparse(url).query
+                links[rel] = dict(urllib.parse.parse_qsl(query))
+    return links
+
+
 def get_rate_limit_date(value):
     # type: (str) -> datetime.datetime | None
     if value is not None:
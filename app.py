@@ -1,7 +1,14 @@
+import asyncio
 import botautosharetags
+import concurrent.futures
 import config
 import logging.config
+import metrics
+import profiling
+import random
+import scheduler
 import signal
+import threading
 import time
 
 bot_type_mapping = {
@@ -9,11 +16,22 @@ bot_type_mapping = {
 }
 
 exit_flag = False
+reload_flag = False
+wakeup_event = threading.Event()
+
+heartbeat_interval = 30
 
 
 def interrupt_handler(signum, frame):
     global exit_flag
     exit_flag = True
+    wakeup_event.set()
+
+
+def reload_handler(signum, frame):
+    global reload_flag
+    reload_flag = True
+    wakeup_event.set()
 
 
 class App:
@@ -24,6 +42,16 @@ class App:
         self.bots = {}
         self.logging_bootstrapped = False
         self.config = None
+        self.heartbeat_callback = None
+        self.task_scheduler = None
+        self.all_bots = False
+        self.requested_identifiers = []
+        self.config_check_interval = 10
+        self.async_wake_event = None
+        self.async_locks = {}
+        self.async_bot_tasks = {}
+        self.async_running = {}  # (bot, task name) -> start time of the run in a worker thread
+        self.profiler = None  # type: profiling.Profiler | None
 
     def bootstrap_logging(self):
         if not self.logging_bootstrapped:
@@ -39,19 +67,127 @@ class App:
             self.config = config.Config(self.config_path)
         return self.config
 
-    def create_bot(self, identifier):
+    def get_bot_class(self, identifier):
         bot_type = self.get_config().get_config().get(identifier, 'Type')
         cls = bot_type_mapping.get(bot_type)
         if not cls:
             raise Exception(f"Invalid bot type '{bot_type}'")
+        return cls
+
+    def create_bot(self, identifier):
+        cls = self.get_bot_class(identifier)
 
         self.bootstrap_logging()
         return cls(identifier, self.get_config())
 
+    def start_metrics(self, port=None, host='127.0.0.1', summary_interval=None):
+        if port is not None:
+            metrics.start_http_server(port, host)
+            self.get_logger().info(f"Serving metrics on http://{host}:{port}/metrics")
+        if summary_interval:
+            metrics.start_summary_logger(self.get_logger('metrics'), summary_interval)
+
+    def enable_profiling(self, output_dir='.', cycles=10):
+        # SIGUSR1: cProfile of the next cycles, SIGUSR2: start then diff tracemalloc snapshots
+        self.profiler = profiling.Profiler(self.get_logger('profiling'), output_dir, cycles)
+
+    def get_scheduled_task_count(self):
+        return sum(len(bot.get_scheduled_tasks()) for bot in self.bots.values() if bot)
+
+    def run_bot_task(self, bot, task):
+        # True when the task stopped on its cycle budget with work left
+        if self.profiler is not None and self.profiler.active:
+            return self.profiler.run(bot.identifier, bot.run_task, task)
+        return bot.run_task(task)
+
     def add_bot(self, identifier):
+        if identifier not in self.requested_identifiers:
+            self.requested_identifiers.append(identifier)
         if identifier not in self.bots:
             self.bots[identifier] = None
 
+    def add_all_bots(self):
+        # follows config.ini: sections added or removed later start or stop their bot on reload
+        self.all_bots = True
+        for identifier in self.get_wanted_identifiers():
+            self.add_bot(identifier)
+
+    def get_wanted_identifiers(self):
+        config = self.get_config().get_config()
+        if self.all_bots:
+            return [s for s in config.sections() if config.has_option(s, 'Type')]
+        return [i for i in self.requested_identifiers if config.has_section(i)]
+
+    def remove_bot(self, identifier):
+        bot = self.bots.pop(identifier, None)
+        if bot:
+            bot.close()
+        self.get_logger().info(f"Bot {identifier} removed")
+
+    def check_config(self, force=False):
+        # type: (bool) -> tuple[list, list, list] | None
+        bot_config = self.get_config()
+        previous = bot_config.config
+        try:
+            if not bot_config.reload_if_changed(force):
+                return None
+        except Exception as e:
+            self.get_logger().error(f"Config reload failed, keeping the current config - {e}")
+            return None
+
+        wanted = self.get_wanted_identifiers()
+        added = [i for i in wanted if i not in self.bots]
+        removed = [i for i in self.bots if i not in wanted]
+        kept = [i for i in self.bots if i in wanted]
+        if self.bots and not kept:
+            # most likely a truncated or half written file, stopping the process stops every bot
+            bot_config.config = previous
+            self.get_logger().error("Config reload failed, keeping the current config - no running bot left in it")
+            return None
+
+        self.get_logger().info("Config reloaded")
+        return added, removed, kept
+
+    def reload_bot(self, identifier):
+        # type: (str) -> bool
+        bot = self.bots.get(identifier)
+        if not bot:
+            return False  # not created yet, reads the new config when it is
+
+        try:
+            if type(bot) != self.get_bot_class(identifier):
+                self.get_logger().info(f"Bot {identifier} type changed, restarting it")
+                bot.close()
+                self.bots[identifier] = self.create_bot(identifier)
+                return True
+            return bot.reload_settings()
+        except Exception as e:
+            self.get_logger().error(f"Invalid settings for {identifier}, keeping the current ones - {e}")
+            return False
+
+    def reload_bots(self, force=False):
+        plan = self.check_config(force)
+        if plan is None:
+            return
+
+        added, removed, kept = plan
+        for identifier in removed:
+            self.task_scheduler.remove(lambda key: key[0] == identifier)
+            self.remove_bot(identifier)
+
+        for identifier in kept:
+            if self.reload_bot(identifier):
+                self.schedule_bot(identifier)
+
+        for identifier in added:
+            self.add_bot(identifier)
+            try:
+                self.schedule_bot(identifier)
+                self.get_logger().info(f"Bot {identifier} added")
+            except Exception as e:
+                self.get_logger().error(f"Failed to start bot {identifier} - {e}")
+                self.bots.pop(identifier, None)
+
     def get_bot(self, identifier):
         bot = self.bots[identifier]
         if not bot:
@@ -63,18 +199,270 @@ class App:
         return self.bots.keys()
 
     def process_loop(self):
+        global reload_flag
+
         signal.signal(signal.SIGINT, interrupt_handler)
         signal.signal(signal.SIGTERM, interrupt_handler)
+        signal.signal(signal.SIGHUP, reload_handler)
+        if self.profiler is not None:
+            signal.signal(signal.SIGUSR1, self.profile_handler)
+            signal.signal(signal.SIGUSR2, self.profile_handler)
 
         self.get_logger().info("Starting process loop...")
 
-        while not exit_flag:
-            self.process_bots()
+        self.task_scheduler = scheduler.TaskScheduler(wakeup=wakeup_event)
+        for identifier in self.get_bot_identifiers():
+            self.schedule_bot(identifier)
+        if self.config_check_interval:
+            self.task_scheduler.add((None, self.reload_bots), self.config_check_interval)
+
+        try:
+            while not exit_flag:
+                if reload_flag:
+                    reload_flag = False
+                    self.reload_bots(force=True)
+                if self.profiler is not None:
+                    self.profiler.check_requests(self.get_scheduled_task_count())
+
+                self.process_due_tasks()
+                self.heartbeat()
 
-            time.sleep(1)
+                # sleeps until the earliest task is due, a signal wakes it up early
+                self.task_scheduler.wait(heartbeat_interval if self.heartbeat_callback else None)
+        finally:
+            self.flush_bots()
 
         self.get_logger().info("Exit requested")
 
     def process_bots(self):
         for identifier in self.get_bot_identifiers():
-            self.get_bot(identifier).process()
+            bot = self.get_bot(identifier)
+            bot.process()
+            bot.flush_if_due()
+
+    def schedule_bot(self, identifier):
+        # also applies changed periods and tasks after a settings reload
+        tasks = self.get_bot(identifier).get_scheduled_tasks()
+        keys = [(identifier, task) for task, period in tasks]
+        self.task_scheduler.remove(lambda key: key[0] == identifier and key not in keys)
+        for task, period in tasks:
+            if not self.task_scheduler.set_period((identifier, task), period):
+                self.task_scheduler.add((identifier, task), period)
+
+    def process_due_tasks(self):
+        processed_bots = {}
+        for (identifier, task), period, due_time in self.task_scheduler.pop_due():
+            if identifier is None:
+                task()
+                self.task_scheduler.reschedule((identifier, task), period, due_time)
+                continue
+
+            if identifier not in self.bots or task.__self__ is not self.get_bot(identifier):
+                continue  # removed or restarted by a config reload earlier in this batch, not rescheduled
+            bot = self.get_bot(identifier)
+
+            delay = None
+            if bot.check_api_rate_limit():
+                if self.run_bot_task(bot, task):
+                    delay = 0  # cycle budget spent with work left: runs again after the other due tasks
+                elif bot.actions_pending and task != bot.process_actions:
+                    # not after a pause, the next run of the paused task comes first
+                    self.run_bot_task(bot, bot.process_actions)
+            else:
+                delay = bot.get_rate_limit_delay()  # next run when the rate limit window resets
+
+            self.task_scheduler.reschedule((identifier, task), period, due_time, delay=delay)
+            processed_bots[identifier] = bot
+
+        for bot in processed_bots.values():
+            bot.flush_if_due()
+
+    def profile_handler(self, signum, frame):
+        if signum == signal.SIGUSR1:
+            self.profiler.request_cpu()
+        else:
+            self.profiler.request_memory()
+        wakeup_event.set()
+
+    def heartbeat(self):
+        if self.heartbeat_callback is not None:
+            self.heartbeat_callback()
+
+    def flush_bots(self):
+        for bot in self.bots.values():
+            if bot:
+                bot.flush()
+
+    def process_loop_async(self, concurrency=None):
+        signal.signal(signal.SIGINT, interrupt_handler)
+        signal.signal(signal.SIGTERM, interrupt_handler)
+        signal.signal(signal.SIGHUP, reload_handler)
+
+        self.get_logger().info("Starting async process loop...")
+
+        try:
+            asyncio.run(self.async_process_loop(concurrency))
+        finally:
+            self.flush_bots()
+
+        self.get_logger().info("Exit requested")
+
+    async def async_process_loop(self, concurrency=None):
+        bots = [self.get_bot(identifier) for identifier in self.get_bot_identifiers()]
+        if not concurrency:
+            concurrency = max(len(bots), 1)
+
+        loop = asyncio.get_running_loop()
+        # the loop only schedules: bots and their ApiClient stay blocking, each task runs in a thread of this pool,
+        # a slow instance holds one thread and not the others
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='bot')
+        loop.set_default_executor(executor)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        exit_event = asyncio.Event()
+        self.async_wake_event = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.async_interrupt_handler, exit_event)
+        loop.add_signal_handler(signal.SIGHUP, self.async_reload_handler)
+        if self.profiler is not None:
+            loop.add_signal_handler(signal.SIGUSR1, self.async_profile_handler, signal.SIGUSR1)
+            loop.add_signal_handler(signal.SIGUSR2, self.async_profile_handler, signal.SIGUSR2)
+
+        for identifier in self.get_bot_identifiers():
+            self.async_start_bot(identifier, semaphore)
+        heartbeat = asyncio.create_task(self.async_heartbeat(exit_event))
+
+        await self.async_watch_config(semaphore)
+        await asyncio.gather(heartbeat, *self.async_bot_tasks.values())
+
+    def async_start_bot(self, identifier, semaphore):
+        # starts the tasks not running yet, running ones pick up period changes themselves
+        bot = self.get_bot(identifier)
+        # tasks of the same bot share its api connection and dbs, never run them at the same time
+        lock = self.async_locks.setdefault(identifier, asyncio.Lock())
+        self.async_bot_tasks = {k: t for k, t in self.async_bot_tasks.items() if not t.done()}
+        for task, period in bot.get_scheduled_tasks():
+            # keyed by bot object: tasks of a restarted bot start while the old ones wind down
+            key = (bot, task.__name__)
+            if key not in self.async_bot_tasks:
+                self.async_bot_tasks[key] = asyncio.create_task(
+                    self.async_process_bot_task(identifier, bot, task, period, lock, semaphore))
+
+    def async_wake(self):
+        # wakes every sleeping task, they check for exit and changed settings
+        wake_event = self.async_wake_event
+        self.async_wake_event = asyncio.Event()
+        wake_event.set()
+
+    def async_reload_handler(self):
+        global reload_flag
+        reload_flag = True
+        self.async_wake()
+
+    def async_profile_handler(self, signum):
+        self.profile_handler(signum, None)
+        self.profiler.check_requests(self.get_scheduled_task_count())
+
+    async def async_watch_config(self, semaphore):
+        global reload_flag
+
+        while not exit_flag:
+            if not reload_flag:
+                await self.async_sleep(self.config_check_interval or None, self.async_wake_event)
+                if exit_flag:
+                    break
+                if not reload_flag and not self.config_check_interval:
+                    continue
+
+            force = reload_flag
+            reload_flag = False
+            plan = await asyncio.to_thread(self.check_config, force)
+            if plan is None:
+                continue
+
+            added, removed, kept = plan
+            for identifier in removed:
+                async with self.async_locks.pop(identifier, asyncio.Lock()):
+                    await asyncio.to_thread(self.remove_bot, identifier)
+
+            for identifier in kept:
+                async with self.async_locks.setdefault(identifier, asyncio.Lock()):
+                    await asyncio.to_thread(self.reload_bot, identifier)
+
+            self.async_wake()
+
+            for identifier in added + kept:
+                self.add_bot(identifier)
+                try:
+                    self.async_start_bot(identifier, semaphore)
+                except Exception as e:
+                    self.get_logger().error(f"Failed to start bot {identifier} - {e}")
+                    self.bots.pop(identifier, None)
+                    continue
+                if identifier in added:
+                    self.get_logger().info(f"Bot {identifier} added")
+
+    def async_interrupt_handler(self, exit_event):
+        interrupt_handler(None, None)
+        exit_event.set()
+        self.async_wake()
+
+    async def async_sleep(self, delay, exit_event):
+        try:
+            await asyncio.wait_for(exit_event.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def async_heartbeat(self, exit_event):
+        while not exit_flag:
+            # only while bot tasks make progress: a task hung in its worker thread stops the heartbeats,
+            # as it stops the sync loop
+            started = min(self.async_running.values(), default=None)
+            if started is None or time.monotonic() - started < heartbeat_interval:
+                self.heartbeat()
+            await self.async_sleep(heartbeat_interval, exit_event)
+
+    async def async_process_bot_task(self, identifier, bot, task, period, lock, semaphore):
+        next_time = time.monotonic() + random.uniform(0, period)
+
+        while not exit_flag:
+            now = time.monotonic()
+            if now < next_time:
+                await self.async_sleep(next_time - now, self.async_wake_event)
+
+                # removed, restarted or rescheduled by a config reload while sleeping
+                if self.bots.get(identifier) is not bot:
+                    return
+                new_period = self.get_task_period(bot, task)
+                if new_period is None:
+                    return
+                next_time += new_period - period
+                period = new_period
+                continue
+
+            delay = period
+            # the bot lock first: tasks waiting for a sibling task of their bot hold no concurrency slot
+            async with lock, semaphore:
+                if self.bots.get(identifier) is not bot:
+                    return
+                key = (bot, task.__name__)
+                self.async_running[key] = time.monotonic()
+                try:
+                    if bot.check_api_rate_limit():
+                        if await asyncio.to_thread(self.run_bot_task, bot, task):
+                            delay = 0  # cycle budget spent with work left
+                    else:
+                        delay = bot.get_rate_limit_delay()
+                    await asyncio.to_thread(bot.flush_if_due)
+                finally:
+                    del self.async_running[key]
+
+            next_time = time.monotonic() + delay
+            if not delay:
+                await asyncio.sleep(0)  # tasks waiting for the semaphore go first
+
+    def get_task_period(self, bot, task):
+        for scheduled_task, period in bot.get_scheduled_tasks():
+            if scheduled_task == task:
+                return period
+        return None
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app  # noqa: E402
+import fakemastodon  # noqa: E402
+import metrics  # noqa: E402
+import userstore  # noqa: E402
+
+logging_config = '''[loggers]
+keys=root
+
+[handlers]
+keys=console
+
+[formatters]
+keys=simple
+
+[logger_root]
+level=WARNING
+handlers=console
+
+[handler_console]
+class=StreamHandler
+level=WARNING
+formatter=simple
+args=(sys.stderr,)
+
+[formatter_simple]
+format=%(asctime)s - %(name)s - %(levelname)s - %(message)s
+'''
+
+
+def write_config(path, base_url, bots, check_frequency, extra):
+    with open(path, 'w') as f:
+        for i in range(bots):
+            f.write(f'''[bench{i}]
+InstanceBaseUrl = {base_url}
+UserApiKey = bench{i}
+Type = AutoShareTags
+UserStore = sqlite
+UserLimit = 100000000
+BoostLimit = 100000000
+NotificationFetchMode = mentions
+TimelineCheckFrequency = {check_frequency}
+NotificationCheckFrequency = {check_frequency}
+ActionCheckFrequency = {check_frequency}
+{extra}
+''')
+
+
+def seed_users(identifier, users, tags):
+    store = userstore.UserStoreSqlite(logging.getLogger('bench'), f'users.{identifier}.sqlite3')
+    store.open()
+    for i in range(users):
+        store.save(userstore.UserRecord(fakemastodon.get_user_uri(i), True, hashtags=[f'tag{i % tags}']))
+    store.close()
+
+
+def get_task_runs(task):
+    with metrics.bot_task_duration.lock:
+        return sum(counts[-1] for key, counts in metrics.bot_task_duration.values.items() if key[1] == task)
+
+
+def get_percentile(values, percentile):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * percentile / 100), len(values) - 1)]
+
+
+def run_scenario(scenario, path, results):
+    os.chdir(path)
+
+    fake = fakemastodon.FakeMastodon(scenario['latency'], scenario['jitter'], scenario['error_rate'],
+                                     scenario['rate_limit'], scenario['rate_limit_window'],
+                                     error_methods=tuple(scenario['error_methods']))
+    fake.start()
+
+    identifiers = [f'bench{i}' for i in range(scenario['bots'])]
+    write_config('config.ini', fake.get_base_url(), scenario['bots'], scenario['check_frequency'],
+                 scenario['extra_config'])
+    with open('logging.conf', 'w') as f:
+        f.write(logging_config)
+
+    for identifier in identifiers:
+        seed_users(identifier, scenario['users'], scenario['tags'])
+
+    a = app.App('config.ini', 'logging.conf')
+    for identifier in identifiers:
+        a.add_bot(identifier)
+
+    generator = fakemastodon.LoadGenerator(fake, identifiers, scenario['users'], scenario['status_rate'],
+                                           scenario['mention_rate'], scenario['tags'])
+    generator.start()
+
+    stopper = threading.Timer(scenario['duration'], app.interrupt_handler, (None, None))
+    stopper.start()
+
+    start_time = time.perf_counter()
+    if scenario['use_async']:
+        a.process_loop_async()
+    else:
+        a.process_loop()
+    duration = time.perf_counter() - start_time
+
+    generator.stop()
+    fake.stop()
+
+    stats = fake.get_stats()
+    cycles = get_task_runs('run_notifications')
+    latencies = stats['boost_latencies']
+    totals = metrics.registry.get_totals()
+
+    results.put({
+        'scenario': scenario,
+        'duration': duration,
+        'statuses_per_sec': totals['masto_statuses_processed_total'] / duration,
+        'notifications_per_sec': totals['masto_notifications_processed_total'] / duration,
+        'boosts_per_sec': stats['boosts'] / duration,
+        'boosts': stats['boosts'],
+        'boosts_pending': stats['boosts_pending'],
+        'requests': stats['requests'],
+        'requests_per_cycle': stats['requests'] / cycles if cycles else None,
+        'errors': stats['errors'],
+        'rate_limited': stats['rate_limited'],
+        'latency_p50': get_percentile(latencies, 50),
+        'latency_p99': get_percentile(latencies, 99),
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'endpoints': stats['endpoints'],
+    })
+
+
+def run_isolated(scenario):
+    # one process per scenario: peak rss and module level registries start fresh,
+    # the working directory is removed once it is gone since bots keep their db files open until exit
+    path = tempfile.mkdtemp(prefix='bench_bots')
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_scenario, args=(scenario, path, results))
+    process.start()
+    try:
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    return {'scenario': scenario, 'failed': True}
+    finally:
+        process.join()
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def format_value(value, fmt):
+    return format(value, fmt) if value is not None else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs bots against a local fake Mastodon server and reports '
+                                                 'throughput, latency and memory')
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000], help='registered users per bot')
+    parser.add_argument('--bots', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--status-rates', type=float, nargs='+', default=[10, 50],
+                        help='home statuses per second and bot')
+    parser.add_argument('--mention-rate', type=float, default=2, help='boost mentions per second and bot')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario')
+    parser.add_argument('--check-frequency', type=float, default=1)
+    parser.add_argument('--tags', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--error-methods', nargs='+', default=['POST'],
+                        help='request methods errors are injected in')
+    parser.add_argument('--rate-limit', type=int, default=10000,
+                        help='requests per window and bot, mastodon uses 300 per 5 minutes')
+    parser.add_argument('--rate-limit-window', type=float, default=300)
+    parser.add_argument('--async', dest='use_async', action='store_true')
+    parser.add_argument('--config', default='', help='extra config lines added to every bot section')
+    parser.add_argument('--output', help='write results as json to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"users":>7} {"bots":>5} {"rate":>6} {"st/s":>8} {"boost/s":>8} {"req/cyc":>8} '
+          f'{"p50 ms":>8} {"p99 ms":>8} {"rss MiB":>8}')
+    for users, bots, status_rate in itertools.product(args.users, args.bots, args.status_rates):
+        scenario = {'users': users, 'bots': bots, 'status_rate': status_rate, 'mention_rate': args.mention_rate,
+                    'duration': args.duration, 'check_frequency': args.check_frequency, 'tags': args.tags,
+                    'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate,
+                    'error_methods': args.error_methods,
+                    'rate_limit': args.rate_limit, 'rate_limit_window': args.rate_limit_window,
+                    'use_async': args.use_async, 'extra_config': args.config}
+        result = run_isolated(scenario)
+        results.append(result)
+        if result.get('failed'):
+            print(f'{users:>7} {bots:>5} {status_rate:>6g} failed')
+            continue
+
+        p50 = result['latency_p50'] * 1000 if result['latency_p50'] is not None else None
+        p99 = result['latency_p99'] * 1000 if result['latency_p99'] is not None else None
+        print(f'{users:>7} {bots:>5} {status_rate:>6g} {result["statuses_per_sec"]:>8.1f} '
+              f'{result["boosts_per_sec"]:>8.1f} {format_value(result["requests_per_cycle"], ">8.1f")} '
+              f'{format_value(p50, ">8.0f")} {format_value(p99, ">8.0f")} {result["peak_rss_kib"] / 1024:>8.1f}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'time': time.time(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import contentparser  # noqa: E402
+
+re_clear_mentions = re.compile(r'@\w+')
+
+
+class LegacyContentParser(HTMLParser):
+    # previous implementation: string concatenation, mentions removed by a regex afterwards
+    def __init__(self, **kwargs):
+        self.t = ''
+        super().__init__(**kwargs)
+
+    def handle_endtag(self, tag):
+        if tag.lower() in ('p', 'div', 'br', 'h1', 'h2', 'h3'):
+            self.t += '\n'
+
+    def handle_data(self, data):
+        self.t += data
+
+    def get_content_text(self, content):
+        self.reset()
+        self.t = ''
+        self.feed(content)
+        return self.t
+
+
+def create_mention(i):
+    return f'<span class="h-card" translate="no"><a href="https://remote.example/@user{i}" class="u-url mention">' \
+           f'@<span>user{i}</span></a></span>'
+
+
+def create_hashtag(tag):
+    return f'<a href="https://mastodon.local/tags/{tag}" class="mention hashtag" rel="tag">#<span>{tag}</span></a>'
+
+
+def create_typical(i):
+    text = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * random.randint(1, 4)
+    return f'<p>{create_mention(i)} boost this please</p><p>{text}{create_hashtag("tag" + str(i % 50))}</p>'
+
+
+def create_large(i):
+    paragraphs = []
+    for n in range(200):
+        paragraphs.append(f'<p>Paragraph {n} with a <a href="https://example.com/{n}" rel="nofollow noopener" '
+                          f'target="_blank"><span class="invisible">https://</span><span class="">example.com/{n}'
+                          f'</span></a> link<br />and a second line</p>')
+    return create_mention(i) + ' ' + ''.join(paragraphs)
+
+
+def create_entities(i):
+    return '<p>' + 'a &amp; b &lt; c &#39; d &quot; ' * 2000 + '</p>'
+
+
+def create_mentions(i):
+    return '<p>' + ' '.join(create_mention(n) for n in range(500)) + ' stop</p>'
+
+
+def create_nested(i):
+    return '<p>' + '<span>' * 500 + 'deep' + '</span>' * 500 + '</p>'
+
+
+def create_unusual(i):
+    # falls back to HTMLParser
+    return f'<div><blockquote><p>{create_mention(i)} quoted <em>text</em></p></blockquote><!-- comment --></div>'
+
+
+corpora = {
+    'typical': create_typical,
+    'large': create_large,
+    'entities': create_entities,
+    'mentions': create_mentions,
+    'nested': create_nested,
+    'unusual': create_unusual,
+}
+
+
+def run_legacy(statuses):
+    parser = LegacyContentParser()
+    return [re.sub(re_clear_mentions, '', parser.get_content_text(status['content'])) for status in statuses]
+
+
+def run_fast(statuses):
+    parser = contentparser.ContentParser(memo_size=0)
+    results = []
+    for status in statuses:
+        text = parser.get_status_text(status, skip_mentions=True)
+        if '@' in text:
+            text = re.sub(re_clear_mentions, '', text)
+        results.append(text)
+    return results
+
+
+def run_memo(statuses, parser):
+    return [parser.get_status_text(status, skip_mentions=True) for status in statuses]
+
+
+def measure(func, *args, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares status html to text extraction')
+    parser.add_argument('--count', type=int, default=200, help='statuses per corpus')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    random.seed(1)
+    print(f'{"corpus":>10} {"legacy us":>10} {"fast us":>10} {"memo us":>10} {"speedup":>8} {"equal":>6}')
+    for name, create in corpora.items():
+        statuses = [{'id': str(i), 'edited_at': None, 'content': create(i)} for i in range(args.count)]
+
+        legacy_duration, legacy_result = measure(run_legacy, statuses, repeat=args.repeat)
+        fast_duration, fast_result = measure(run_fast, statuses, repeat=args.repeat)
+
+        memo_parser = contentparser.ContentParser(memo_size=args.count)
+        run_memo(statuses, memo_parser)
+        memo_duration, memo_result = measure(run_memo, statuses, memo_parser, repeat=args.repeat)
+
+        equal = legacy_result == fast_result
+        per_status = 1000000 / args.count
+        print(f'{name:>10} {legacy_duration * per_status:>10.1f} {fast_duration * per_status:>10.1f} '
+              f'{memo_duration * per_status:>10.2f} {legacy_duration / fast_duration:>7.1f}x {str(equal):>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import hashtagindex  # noqa: E402
+import userstore  # noqa: E402
+
+
+def create_users(count, tag_count):
+    users = {}
+    for i in range(count):
+        data = {'boost': i % 4 != 0, 'blocked': i % 97 == 0}
+        if i % 10 != 0:
+            data['hashtags'] = [f'Tag{random.randrange(tag_count)}' for _ in range(random.randint(1, 3))]
+        users[f'https://mastodon.local/users/user{i}'] = json.dumps(data)
+    return users
+
+
+def create_statuses(count, user_count, tag_count):
+    statuses = []
+    for i in range(count):
+        # most home statuses come from followed accounts that are not registered users
+        author = random.randrange(user_count * 4)
+        tags = [{'name': f'tag{random.randrange(tag_count)}'} for _ in range(random.randint(0, 2))]
+        statuses.append({'id': str(i), 'account': {'uri': f'https://mastodon.local/users/user{author}'}, 'tags': tags})
+    return statuses
+
+
+def has_status_hashtag(status, hashtags):
+    status_tags = status.get('tags', [])
+    if len(status_tags) > 0:
+        if len(hashtags) == 0:
+            return True
+
+        for tag in status_tags:
+            if tag.get('name') in hashtags:
+                return True
+
+
+def filter_scan(users, statuses):
+    matched = 0
+    for status in statuses:
+        # record loaded for every status, as get_user_data did
+        user_data = json.loads(users.get(status['account']['uri'], '{}'))
+        if user_data.get('blocked', False) or not user_data.get('boost', False):
+            continue
+        if has_status_hashtag(status, [t.casefold() for t in user_data.get('hashtags', [])]):
+            matched += 1
+    return matched
+
+
+def filter_index(index, users, statuses):
+    matched = 0
+    for status in statuses:
+        uri = status['account']['uri']
+        if not index.match(uri, status.get('tags', [])):
+            continue
+        user_data = json.loads(users[uri])
+        if user_data.get('blocked', False) or not user_data.get('boost', False):
+            continue
+        matched += 1
+    return matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares home timeline hashtag filtering strategies')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--statuses', type=int, default=50000)
+    parser.add_argument('--tags', type=int, default=500)
+    args = parser.parse_args()
+
+    random.seed(1)
+    users = create_users(args.users, args.tags)
+    statuses = create_statuses(args.statuses, args.users, args.tags)
+
+    start = time.perf_counter()
+    index = hashtagindex.HashtagIndex()
+    index.build((uri, userstore.get_user_record(uri, json.loads(data))) for uri, data in users.items())
+    build_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scan_matched = filter_scan(users, statuses)
+    scan_duration = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index_matched = filter_index(index, users, statuses)
+    index_duration = time.perf_counter() - start
+
+    print(f'users {args.users}, statuses {args.statuses}, index build {build_duration:.4f}s')
+    print(f'scan   {scan_duration:.4f}s matched {scan_matched}')
+    print(f'index  {index_duration:.4f}s matched {index_matched}')
+
+
+if __name__ == '__main__':
+    main()
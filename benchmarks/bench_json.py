@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import jsondecode  # noqa: E402
+
+
+def create_account(i):
+    return {
+        'id': str(100000 + i), 'username': f'user{i}', 'acct': f'user{i}@remote.example',
+        'display_name': f'User {i} :blobcat:', 'locked': False, 'bot': False, 'discoverable': True,
+        'group': False, 'created_at': '2022-11-01T00:00:00.000Z', 'note': '<p>' + 'Some bio text. ' * 20 + '</p>',
+        'url': f'https://remote.example/@user{i}', 'uri': f'https://remote.example/users/user{i}',
+        'avatar': f'https://files.example/accounts/avatars/{i}/original/a.png',
+        'avatar_static': f'https://files.example/accounts/avatars/{i}/original/a.png',
+        'header': f'https://files.example/accounts/headers/{i}/original/h.png',
+        'header_static': f'https://files.example/accounts/headers/{i}/original/h.png',
+        'followers_count': 1234, 'following_count': 321, 'statuses_count': 9876,
+        'last_status_at': '2024-01-01',
+        'emojis': [{'shortcode': 'blobcat', 'url': 'https://files.example/e.png',
+                    'static_url': 'https://files.example/e.png', 'visible_in_picker': True}],
+        'fields': [{'name': f'field{n}', 'value': '<a href="https://example.com">example.com</a>',
+                    'verified_at': None} for n in range(4)],
+    }
+
+
+def create_status(i):
+    tags = [f'tag{random.randrange(100)}' for _ in range(random.randint(0, 4))]
+    content = '<p>' + 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * random.randint(1, 8)
+    content += ' '.join(f'<a href="https://mastodon.local/tags/{t}" class="mention hashtag" rel="tag">#<span>{t}</span></a>'
+                        for t in tags) + '</p>'
+    return {
+        'id': str(110000000000000000 + i), 'created_at': '2024-01-01T00:00:00.000Z', 'in_reply_to_id': None,
+        'in_reply_to_account_id': None, 'sensitive': False, 'spoiler_text': '', 'visibility': 'public',
+        'language': 'en', 'uri': f'https://remote.example/users/user{i}/statuses/{i}',
+        'url': f'https://remote.example/@user{i}/{i}', 'replies_count': 3, 'reblogs_count': 5,
+        'favourites_count': 12, 'edited_at': None, 'favourited': False, 'reblogged': False, 'muted': False,
+        'bookmarked': False, 'content': content, 'filtered': [], 'reblog': None,
+        'application': {'name': 'Web', 'website': None},
+        'account': create_account(i % 500),
+        'media_attachments': [{'id': str(i), 'type': 'image', 'url': 'https://files.example/m.png',
+                               'preview_url': 'https://files.example/p.png', 'remote_url': None,
+                               'meta': {'original': {'width': 1200, 'height': 800, 'size': '1200x800', 'aspect': 1.5},
+                                        'small': {'width': 600, 'height': 400, 'size': '600x400', 'aspect': 1.5}},
+                               'description': 'An image description ' * 5, 'blurhash': 'UBL_:rOpGG-oBUNG,qRj2so|=eE1w^n4S5NH'}
+                              for _ in range(random.randint(0, 2))],
+        'mentions': [], 'tags': [{'name': t, 'url': f'https://mastodon.local/tags/{t}'} for t in tags],
+        'emojis': [], 'card': None, 'poll': None,
+    }
+
+
+def load_pages(path):
+    # recorded api traffic, one json object per line with a "body" member holding the response text
+    pages = []
+    with open(path, 'rb') as f:
+        for line in f:
+            record = json.loads(line)
+            if '/timelines/home' in record.get('path', '') and record.get('body'):
+                pages.append(record['body'].encode('utf-8'))
+    return pages
+
+
+def decode_legacy(data):
+    return json.loads(str(data, 'utf-8'))
+
+
+def decode_stdlib_bytes(data):
+    return json.loads(data)
+
+
+def decode_backend(data):
+    return jsondecode.loads(data)
+
+
+def decode_backend_projected(data):
+    return [jsondecode.project_status(s) for s in jsondecode.loads(data)]
+
+
+def measure(func, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            func(page)
+    duration = (time.perf_counter() - start) / (repeat * len(pages))
+
+    tracemalloc.start()
+    kept = func(pages[0])
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+
+    return duration, peak, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures home timeline page decoding time and memory')
+    parser.add_argument('--recording', help='recorded api traffic (jsonl) to take home timeline pages from')
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--page-size', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.recording:
+        pages = load_pages(args.recording)
+    else:
+        random.seed(1)
+        pages = [json.dumps([create_status(p * args.page_size + i) for i in range(args.page_size)]).encode('utf-8')
+                 for p in range(args.pages)]
+
+    if not pages:
+        print('no home timeline pages')
+        return
+
+    print(f'{len(pages)} pages, avg {sum(len(p) for p in pages) / len(pages) / 1024:.1f} KiB, '
+          f'backend {jsondecode.get_backend_name()}')
+    print(f'{"decoder":>22} {"ms/page":>10} {"peak KiB":>10} {"kept KiB":>10}')
+    for name, func in (('str + json.loads', decode_legacy),
+                       ('json.loads(bytes)', decode_stdlib_bytes),
+                       ('jsondecode.loads', decode_backend),
+                       ('jsondecode + project', decode_backend_projected)):
+        duration, peak, retained = measure(func, pages, args.repeat)
+        print(f'{name:>22} {duration * 1000:>10.3f} {peak / 1024:>10.1f} {retained / 1024:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import dailycounters  # noqa: E402
+import hashtagindex  # noqa: E402
+import userstore  # noqa: E402
+
+today = '20240101'
+
+
+class LegacyHashtagIndex:
+    # previous implementation: a set of tags per user, strings as decoded
+    def __init__(self):
+        self.tag_users = {}
+        self.any_tag_users = set()
+        self.user_tags = {}
+
+    def update(self, uri, data):
+        if data.get('blocked', False) or not data.get('boost', False):
+            return
+
+        hashtags = data.get('hashtags') or []
+        if len(hashtags) == 0:
+            self.any_tag_users.add(uri)
+            return
+
+        tags = {tag.casefold() for tag in hashtags}
+        for tag in tags:
+            self.tag_users.setdefault(tag, set()).add(uri)
+        self.user_tags[uri] = tags
+
+
+def create_rows(count, tag_count):
+    # stored records as read back from the user store, one json document per user
+    rows = []
+    for i in range(count):
+        data = {'boost': True, 'hashtags': [f'Tag{random.randrange(tag_count)}' for _ in range(random.randint(1, 3))]}
+        if i % 3 == 0:
+            data['use'] = {'day': today, 'boosts': i % 7}
+        rows.append((f'https://mastodon.local/users/user{i}', json.dumps(data)))
+    return rows
+
+
+def load_legacy(rows):
+    users = {}
+    index = LegacyHashtagIndex()
+    for uri, value in rows:
+        data = json.loads(value)
+        users[uri] = data
+        index.update(uri, data)
+    return users, index
+
+
+def load_compact(rows):
+    users = {}
+    index = hashtagindex.HashtagIndex()
+    counters = dailycounters.DailyCounters(logging.getLogger('bench'), os.devnull)
+    for uri, value in rows:
+        data = json.loads(value)
+        record = userstore.get_user_record(uri, data)
+        users[record.uri] = record
+        index.update(record.uri, record)
+        use = data.get('use')
+        if use and use.get('day') == today:
+            counters.add(today, 'boosts', record.uri, use['boosts'])
+    return users, index, counters
+
+
+def measure_memory(load, rows):
+    # rows are built from fresh strings so nothing is shared with the input
+    rows = [(uri.encode().decode(), value) for uri, value in rows]
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load(rows)
+    duration = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size, duration
+
+
+def bump_legacy(users, uris):
+    # previous boost accounting: whole record updated and serialized again
+    for uri in uris:
+        data = users[uri]
+        use = data.get('use', {})
+        if use.get('day') != today:
+            use = {'day': today}
+        use['boosts'] = use.get('boosts', 0) + 1
+        data['use'] = use
+        json.dumps(data)
+
+
+def bump_compact(counters, uris):
+    for uri in uris:
+        counters.add(today, 'boosts', uri)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares per user memory of user records and daily counters')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--tags', type=int, default=500)
+    parser.add_argument('--boosts', type=int, default=100000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    rows = create_rows(args.users, args.tags)
+
+    legacy_size, legacy_duration = measure_memory(load_legacy, rows)
+    compact_size, compact_duration = measure_memory(load_compact, rows)
+
+    print(f'{"layout":>8} {"MiB":>8} {"bytes/user":>11} {"load s":>8}')
+    print(f'{"legacy":>8} {legacy_size / 1048576:>8.1f} {legacy_size / args.users:>11.0f} {legacy_duration:>8.3f}')
+    print(f'{"compact":>8} {compact_size / 1048576:>8.1f} {compact_size / args.users:>11.0f} {compact_duration:>8.3f}')
+
+    legacy_users, legacy_index = load_legacy(rows)
+    compact_users, compact_index, counters = load_compact(rows)
+    uris = [random.choice(rows)[0] for _ in range(args.boosts)]
+
+    start = time.perf_counter()
+    bump_legacy(legacy_users, uris)
+    legacy_bump = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bump_compact(counters, uris)
+    compact_bump = time.perf_counter() - start
+
+    print(f'boost count update: legacy {legacy_bump / args.boosts * 1e6:.2f} us, '
+          f'compact {compact_bump / args.boosts * 1e6:.2f} us')
+
+
+if __name__ == '__main__':
+    main()
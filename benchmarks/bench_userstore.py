@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import argparse
+import dbm
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import userstore  # noqa: E402
+
+
+def create_dbm_users(path, count):
+    db = dbm.open(path, 'c')
+    for i in range(count):
+        data = {'boost': i % 3 != 0, 'hashtags': ['tag' + str(i % 50)], 'use': {'day': '20240101', 'boosts': i % 7}}
+        db[f'https://mastodon.local/users/user{i}'] = json.dumps(data)
+    db.close()
+
+
+def measure_cold_start(store, count, lookups):
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    store.open()
+    store.get_registered_count()
+    for i in random.sample(range(count), min(lookups, count)):
+        store.get(f'https://mastodon.local/users/user{i}')
+
+    duration = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    store.close()
+    return duration, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares user store cold start time and memory')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--lookups', type=int, default=100)
+    args = parser.parse_args()
+
+    logger = logging.getLogger('bench')
+
+    print(f'{"users":>8} {"store":>8} {"seconds":>10} {"peak KiB":>10}')
+    for count in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            dbm_path = os.path.join(tmp, 'users.db')
+            sqlite_path = os.path.join(tmp, 'users.sqlite3')
+            create_dbm_users(dbm_path, count)
+
+            # one-shot migration, not part of the cold start
+            migration = userstore.UserStoreSqlite(logger, sqlite_path, dbm_path)
+            migration.open()
+            migration.close()
+
+            for name, store in (('dbm', userstore.UserStoreDbm(logger, dbm_path)),
+                                ('sqlite', userstore.UserStoreSqlite(logger, sqlite_path))):
+                duration, peak = measure_cold_start(store, count, args.lookups)
+                print(f'{count:>8} {name:>8} {duration:>10.4f} {peak / 1024:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# coding=utf-8
+
+import argparse
+import datetime
+import http.server
+import json
+import random
+import threading
+import time
+import urllib.parse
+
+status_path_prefix = '/api/v1/statuses/'
+notification_path_prefix = '/api/v1/notifications/'
+
+
+class Account:
+    def __init__(self, token):
+        self.token = token
+
+        self.home = []  # ordered by id
+        self.notifications = []  # ordered by id
+        self.rate_limit_used = 0
+        self.rate_limit_reset = 0
+
+
+class FakeMastodon:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=300, rate_limit_window=300, page_size=40,
+                 error_methods=('POST',)):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_methods = error_methods
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.page_size = page_size
+
+        self.accounts = {}  # type: dict[str, Account]
+        self.statuses = {}
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.random = random.Random(1)
+
+        # status id -> time the boost was expected from, filled by load generators
+        self.boost_expected = {}
+        self.boost_latencies = []
+        self.boosts = 0
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.endpoint_requests = {}
+
+        self.server = None
+        self.thread = None
+
+    def start(self, host='127.0.0.1', port=0):
+        fake = self
+
+        class Handler(FakeMastodonHandler):
+            server_state = fake
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fakemastodon', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def get_base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    def get_account(self, token):
+        with self.lock:
+            account = self.accounts.get(token)
+            if account is None:
+                account = Account(token)
+                self.accounts[token] = account
+            return account
+
+    def next_id(self):
+        # snowflake-like: millisecond timestamp in the high bits, like mastodon ids
+        with self.lock:
+            new_id = max(int(time.time() * 1000) << 16, self.last_id + 1)
+            self.last_id = new_id
+            return str(new_id)
+
+    def create_status(self, user_uri, account_id, content, tags=(), visibility='public', in_reply_to_id=None):
+        status = {
+            'id': self.next_id(),
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'in_reply_to_id': in_reply_to_id,
+            'visibility': visibility,
+            'content': content,
+            'edited_at': None,
+            'account': {'id': str(account_id), 'uri': user_uri, 'acct': user_uri.rsplit('/', 1)[-1]},
+            'tags': [{'name': tag, 'url': f'https://mastodon.local/tags/{tag}'} for tag in tags],
+            'mentions': [],
+            'reblog': None,
+        }
+        with self.lock:
+            self.statuses[status['id']] = status
+        return status
+
+    def add_home_status(self, token, user_uri, account_id, tags, expect_boost=False):
+        content = '<p>Some text ' + ' '.join(
+            f'<a href="https://mastodon.local/tags/{tag}" class="mention hashtag" rel="tag">#<span>{tag}</span></a>'
+            for tag in tags) + '</p>'
+        status = self.create_status(user_uri, account_id, content, tags)
+        account = self.get_account(token)
+        with self.lock:
+            account.home.append(status)
+            if expect_boost:
+                self.boost_expected[(token, status['id'])] = time.time()
+        return status
+
+    def add_mention(self, token, user_uri, account_id, text, parent_status=None, expect_boost=False):
+        content = f'<p><span class="h-card"><a href="https://mastodon.local/@bot" class="u-url mention">' \
+                  f'@<span>bot</span></a></span> {text}</p>'
+        parent_id = parent_status['id'] if parent_status else None
+        status = self.create_status(user_uri, account_id, content, visibility='direct', in_reply_to_id=parent_id)
+        notification = {'id': self.next_id(), 'type': 'mention', 'created_at': status['created_at'],
+                        'account': status['account'], 'status': status}
+        account = self.get_account(token)
+        with self.lock:
+            account.notifications.append(notification)
+            if expect_boost and parent_id:
+                self.boost_expected[(token, parent_id)] = time.time()
+        return notification
+
+    def check_rate_limit(self, account):
+        # type: (Account) -> tuple[bool, dict]
+        now = time.time()
+        with self.lock:
+            if now >= account.rate_limit_reset:
+                account.rate_limit_used = 0
+                account.rate_limit_reset = now + self.rate_limit_window
+            account.rate_limit_used += 1
+            remaining = max(self.rate_limit - account.rate_limit_used, 0)
+            reset = datetime.datetime.fromtimestamp(account.rate_limit_reset, datetime.timezone.utc)
+            allowed = account.rate_limit_used <= self.rate_limit
+        headers = {'X-RateLimit-Limit': str(self.rate_limit),
+                   'X-RateLimit-Remaining': str(remaining),
+                   'X-RateLimit-Reset': reset.isoformat().replace('+00:00', 'Z')}
+        return allowed, headers
+
+    def record_request(self, endpoint):
+        with self.lock:
+            self.requests += 1
+            self.endpoint_requests[endpoint] = self.endpoint_requests.get(endpoint, 0) + 1
+
+    def record_boost(self, token, status_id):
+        now = time.time()
+        with self.lock:
+            self.boosts += 1
+            expected = self.boost_expected.pop((token, status_id), None)
+            if expected is not None:
+                self.boost_latencies.append(now - expected)
+
+    def get_page(self, items, query):
+        # newest first, min_id pages forward from the cursor, oldest items first
+        limit = min(int(query.get('limit', [self.page_size])[0]), self.page_size)
+        with self.lock:
+            if 'min_id' in query:
+                min_id = int(query['min_id'][0])
+                page = [i for i in items if int(i['id']) > min_id][:limit]
+            elif 'since_id' in query:
+                since_id = int(query['since_id'][0])
+                page = [i for i in items if int(i['id']) > since_id][-limit:]
+            else:
+                page = items[-limit:]
+        return list(reversed(page))
+
+    def get_stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'errors': self.errors, 'rate_limited': self.rate_limited,
+                    'boosts': self.boosts, 'endpoints': dict(self.endpoint_requests),
+                    'boost_latencies': list(self.boost_latencies),
+                    'boosts_pending': len(self.boost_expected)}
+
+
+class FakeMastodonHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_state = None  # type: FakeMastodon
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_link_header(self, path, page):
+        if not page:
+            return {}
+        base = f'http://{self.headers.get("Host", "localhost")}{path}'
+        return {'Link': f'<{base}?max_id={page[-1]["id"]}>; rel="next", <{base}?min_id={page[0]["id"]}>; rel="prev"'}
+
+    def do_GET(self):
+        self.handle_api('GET')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.handle_api('POST')
+
+    def do_DELETE(self):
+        self.handle_api('DELETE')
+
+    def handle_api(self, method):
+        fake = self.server_state
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        path = url.path
+        endpoint = '/'.join(':id' if part.isdigit() else part for part in path.split('/'))
+        fake.record_request(f'{method} {endpoint}')
+
+        token = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        account = fake.get_account(token)
+
+        if fake.latency or fake.jitter:
+            time.sleep(max(fake.latency + fake.random.uniform(-fake.jitter, fake.jitter), 0))
+
+        allowed, headers = fake.check_rate_limit(account)
+        if not allowed:
+            with fake.lock:
+                fake.rate_limited += 1
+            return self.send_json({'error': 'Too many requests'}, 429, headers)
+
+        if fake.error_rate and method in fake.error_methods and fake.random.random() < fake.error_rate:
+            with fake.lock:
+                fake.errors += 1
+            return self.send_json({'error': 'Service unavailable'}, 503, headers)
+
+        if method == 'GET' and path == '/api/v1/timelines/home':
+            page = fake.get_page(account.home, query)
+            headers.update(self.get_link_header(path, page))
+            return self.send_json(page, 200, headers)
+
+        if method == 'GET' and path == '/api/v1/notifications':
+            items = account.notifications
+            types = query.get('types[]')
+            if types:
+                items = [n for n in items if n['type'] in types]
+            page = fake.get_page(items, query)
+            headers.update(self.get_link_header(path, page))
+            return self.send_json(page, 200, headers)
+
+        if method == 'POST' and path == '/api/v1/notifications/clear':
+            with fake.lock:
+                account.notifications = []
+            return self.send_json({}, 200, headers)
+
+        if method == 'POST' and path.startswith(notification_path_prefix) and path.endswith('/dismiss'):
+            notification_id = path.split('/')[-2]
+            with fake.lock:
+                account.notifications = [n for n in account.notifications if n['id'] != notification_id]
+            return self.send_json({}, 200, headers)
+
+        if method == 'GET' and path == '/api/v1/statuses':
+            with fake.lock:
+                statuses = [fake.statuses[i] for i in query.get('id[]', []) if i in fake.statuses]
+            return self.send_json(statuses, 200, headers)
+
+        if path.startswith(status_path_prefix):
+            parts = path[len(status_path_prefix):].split('/')
+            status = fake.statuses.get(parts[0])
+            if status is None:
+                return self.send_json({'error': 'Record not found'}, 404, headers)
+            if method == 'GET' and len(parts) == 1:
+                return self.send_json(status, 200, headers)
+            if method == 'POST' and parts[1:] == ['reblog']:
+                fake.record_boost(token, parts[0])
+                return self.send_json(status, 200, headers)
+            if method == 'POST' and parts[1:] == ['unreblog']:
+                return self.send_json(status, 200, headers)
+
+        if method == 'POST' and path.startswith('/api/v1/accounts/') and path.split('/')[-1] in ('follow',
+                                                                                                'unfollow'):
+            return self.send_json({'id': path.split('/')[-2]}, 200, headers)
+
+        return self.send_json({'error': 'Record not found'}, 404, headers)
+
+
+class LoadGenerator:
+    # posts home statuses and boost mentions for a set of bot tokens at a steady rate
+    def __init__(self, fake, tokens, users, status_rate, mention_rate, tags=50, seed=1):
+        self.fake = fake  # type: FakeMastodon
+        self.tokens = tokens
+        self.users = users
+        self.status_rate = status_rate
+        self.mention_rate = mention_rate
+        self.tags = tags
+        self.random = random.Random(seed)
+
+        self.stop_flag = False
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='loadgen', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_flag = True
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        interval = 0.05
+        status_credit = 0.0
+        mention_credit = 0.0
+        while not self.stop_flag:
+            status_credit += self.status_rate * interval
+            mention_credit += self.mention_rate * interval
+            for token in self.tokens:
+                for _ in range(int(status_credit)):
+                    self.post_status(token)
+                for _ in range(int(mention_credit)):
+                    self.post_mention(token)
+            status_credit -= int(status_credit)
+            mention_credit -= int(mention_credit)
+            time.sleep(interval)
+
+    def post_status(self, token):
+        # registered users are seeded with tag(i % tags), half the statuses carry a matching tag
+        i = self.random.randrange(self.users)
+        matching = self.random.random() < 0.5
+        tag = f'tag{i % self.tags}' if matching else f'other{self.random.randrange(1000)}'
+        self.fake.add_home_status(token, get_user_uri(i), get_user_account_id(i), [tag], expect_boost=matching)
+
+    def post_mention(self, token):
+        i = self.random.randrange(self.users)
+        parent = self.fake.create_status(get_user_uri(i), get_user_account_id(i), '<p>Look at this</p>')
+        self.fake.add_mention(token, get_user_uri(i), get_user_account_id(i), 'share this please', parent, True)
+
+
+def get_user_uri(i):
+    return f'https://remote.example/users/user{i}'
+
+
+def get_user_account_id(i):
+    return 1000 + i
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves a fake Mastodon API for benchmarks and manual runs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random +/- seconds around the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--error-methods', nargs='+', default=['POST'], help='request methods errors are injected in')
+    parser.add_argument('--rate-limit', type=int, default=300, help='requests per window and token')
+    parser.add_argument('--rate-limit-window', type=float, default=300)
+    parser.add_argument('--tokens', nargs='*', default=[], help='bot api keys to generate traffic for')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--status-rate', type=float, default=0, help='home statuses per second and token')
+    parser.add_argument('--mention-rate', type=float, default=0, help='boost mentions per second and token')
+    args = parser.parse_args()
+
+    fake = FakeMastodon(args.latency, args.jitter, args.error_rate, args.rate_limit, args.rate_limit_window,
+                        error_methods=tuple(args.error_methods))
+    fake.start(args.host, args.port)
+    print(f'Serving on {fake.get_base_url()}')
+
+    generator = None
+    if args.tokens and (args.status_rate or args.mention_rate):
+        generator = LoadGenerator(fake, args.tokens, args.users, args.status_rate, args.mention_rate)
+        generator.start()
+
+    try:
+        while True:
+            time.sleep(10)
+            stats = fake.get_stats()
+            print(f'requests {stats["requests"]}, boosts {stats["boosts"]}, errors {stats["errors"]}, '
+                  f'rate limited {stats["rate_limited"]}')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if generator is not None:
+            generator.stop()
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,38 @@
+import actionqueue
 import apiclient
+import bisect
+import budget
+import collections
+import commands
+import concurrent.futures
 import config
+import connpool
 import contentparser
+import dailycounters
 import datetime
 import dbm
-import json
+import hashtagindex
+import http.client
 import logging
+import metrics
+import ratelimit
 import re
+import recording
+import settings
+import statuscache
+import streaming
+import sys
 import time
+import urllib.parse
+import userstore
 
 re_clear_mentions = re.compile(r'@\w+')
 
+home_cursor_keys = ('last_home_id', 'home_backfill_count')
+
+excluded_notification_types = ('status', 'reblog', 'follow', 'follow_request', 'favourite', 'poll', 'update',
+                               'admin.sign_up', 'admin.report')
+
 
 class BotAbstract:
     def __init__(self, identifier, cfg):
@@ -18,28 +41,116 @@ class BotAbstract:
         self.cfg = cfg
 
         self.logger = logging.getLogger(identifier)
+        self.settings = self.load_settings()
         self.content_parser = contentparser.ContentParser()
+        self.command_dispatcher = None
         self.api = None
-        self.users_db = None
-        self.users = None
+        self.user_stream = None
+        self.handled_notification_ids = collections.OrderedDict()
+        self.user_store = None
+        self.hashtag_index = None
+        self.daily_counters = None
+        self.reconcile_uris = None
+        self.budget = None  # type: budget.CycleBudget | None
+        self.task_paused = False
+        self.backlog = {}  # source -> age in seconds of the oldest item left for the next cycle
+        self.status_cache = None
+        self.action_queue = None
+        self.actions_pending = False
+        self.multi_statuses_supported = True
         self.status_db = None
         self.status = {}
+        self.status_pending = set()
+        self.last_time_flush = 0
         self.last_time_home_processing = 0
         self.last_time_notification_processing = 0
-        self.registered_users = 0
+
+    def get_setting_definitions(self):
+        return settings.bot_settings
+
+    def load_settings(self):
+        # type: () -> settings.BotSettings
+        return settings.load_bot_settings(self.cfg, self.identifier, self.get_setting_definitions())
+
+    def reload_settings(self):
+        # raises on invalid settings, the running ones stay in place
+        new_settings = self.load_settings()
+        changes = self.settings.get_changes(new_settings)
+        if not changes:
+            return False
+
+        self.logger.info(f"Settings changed: {', '.join(d.key for d in changes)}")
+        resets = {d.reset for d in changes if d.reset}
+
+        if 'api' in resets or 'stream' in resets:
+            self.close_user_stream()
+        if 'user_store' in resets:
+            self.close_user_store()
+
+        self.settings = new_settings
+
+        if 'api' in resets:
+            self.api = None
+            self.save_status_value('account_id', None)  # another key can be another account
+        if 'api' in resets or 'status_cache' in resets:
+            self.status_cache = None  # shared per instance, configured again when next used
+        if 'commands' in resets:
+            self.command_dispatcher = None
+        return True
+
+    def close(self):
+        self.flush()
+        self.close_user_stream()
+        self.close_user_store()
+        if self.action_queue is not None:
+            self.action_queue.close()
+            self.action_queue = None
+        if self.status_db is not None:
+            self.status_db.close()
+            self.status_db = None
 
     def create_api(self):
         logger_name = self.identifier + '.api'
         logger = logging.getLogger(logger_name)
 
-        base_url = self.cfg.get_config().get(self.identifier, 'InstanceBaseUrl')
-        api_key = self.cfg.get_evaluated(self.identifier, 'UserApiKey')
-        persistent = self.cfg.get_config().getboolean(self.identifier, 'PersistentConnections', fallback=True)
+        base_url = self.settings.instance_base_url
+        api_key = self.settings.user_api_key
+        persistent = self.settings.persistent_connections
+
+        reserve = self.settings.rate_limit_reserve
+        burst = self.settings.rate_limit_burst
+        max_wait = self.settings.rate_limit_max_wait
+        scheduler = ratelimit.get_scheduler((urllib.parse.urlparse(base_url).netloc, api_key), reserve, burst, max_wait)
+        self.log_shared_changes('Rate limit scheduler', scheduler.configure(reserve, burst, max_wait))
+
+        pool_size = self.settings.connection_pool_size
+        idle_timeout = self.settings.connection_idle_timeout
+        timeout = self.settings.connection_timeout
+        pool = connpool.get_pool(base_url, pool_size, idle_timeout, timeout)
+        self.log_shared_changes('Connection pool', pool.configure(pool_size, idle_timeout, timeout))
+
+        # replays recorded traffic instead of sending requests, ReplaySpeed 0 answers without recorded delays
+        replay_path = self.settings.replay_api_traffic
+        if replay_path:
+            replay_speed = self.settings.replay_speed
+            pool = recording.ReplayPool(replay_path, replay_speed, self.identifier)
+
+        recorder = None
+        record_path = self.settings.record_api_traffic
+        if record_path:
+            recorder = recording.get_recorder(record_path)
+
+        project = self.settings.project_statuses
 
         api = apiclient.ApiClient(logger=logger,
                                   persistent=persistent,
                                   base_url=base_url,
-                                  api_key=api_key)
+                                  api_key=api_key,
+                                  scheduler=scheduler,
+                                  pool=pool,
+                                  project=project,
+                                  name=self.identifier,
+                                  recorder=recorder)
         return api
 
     def get_api(self):
@@ -47,77 +158,215 @@ class BotAbstract:
             self.api = self.create_api()
         return self.api
 
-    def get_users_db_path(self):
-        name = f'users.{self.identifier}.db'
-        return name
+    def is_streaming_enabled(self):
+        return self.settings.streaming
 
-    def load_users_db(self):
-        self.users_db = dbm.open(self.get_users_db_path(), 'c')
-        self.users = {}
-        self.registered_users = 0
+    def create_user_stream(self):
+        logger = logging.getLogger(self.identifier + '.stream')
+        base_url = self.settings.streaming_base_url
+        return streaming.UserStream(logger, self.get_api(), base_url)
 
-        self.logger.debug("Loading users db...")
+    def get_user_stream(self):
+        if self.user_stream is None:
+            self.user_stream = self.create_user_stream()
+            self.user_stream.start()
+        return self.user_stream
 
-        for k in self.users_db.keys():
-            strk = str(k, 'utf-8')
+    def close_user_stream(self):
+        if self.user_stream is not None:
+            self.user_stream.stop()
+            self.user_stream = None
 
-            v = self.users_db[k]
-            strv = str(v, 'utf-8')
+    def is_stream_connected(self):
+        return self.user_stream is not None and self.user_stream.is_connected()
 
-            data = None
-            try:
-                data = json.loads(strv)
-            except json.JSONDecodeError as e:
-                pass
+    def get_users_db_path(self):
+        name = f'users.{self.identifier}.db'
+        return name
 
-            if type(data) != dict:
-                self.logger.error(f'Invalid user data {strk}: "{strv}", resetting')
-                data = {}
+    def get_users_sqlite_path(self):
+        name = f'users.{self.identifier}.sqlite3'
+        return name
 
-            if data.get('boost'):
-                self.registered_users += 1
+    def create_user_store(self):
+        logger = logging.getLogger(self.identifier + '.users')
+
+        store_type = self.settings.user_store
+        if store_type == 'dbm':
+            return userstore.UserStoreDbm(logger, self.get_users_db_path())
+        if store_type == 'sqlite':
+            return userstore.UserStoreSqlite(logger, self.get_users_sqlite_path(), self.get_users_db_path())
+
+        raise Exception(f"Invalid user store type '{store_type}'")
+
+    def get_user_store(self):
+        if self.user_store is None:
+            store = self.create_user_store()
+            store.open()
+            self.user_store = store
+            if self.daily_counters is None:
+                # seeded from records still holding their daily use, before any of them is rewritten
+                self.daily_counters = self.create_daily_counters()
+        return self.user_store
+
+    def close_user_store(self):
+        if self.user_store is not None:
+            self.user_store.close()
+            self.user_store = None
+            self.hashtag_index = None
+
+    def get_user(self, uri):
+        # type: (str) -> userstore.UserRecord
+        with metrics.store_duration.time(bot=self.identifier, operation='user_read'):
+            return self.get_user_store().get(uri)
+
+    def save_user(self, user):
+        if type(user) != userstore.UserRecord:
+            raise Exception(f'Invalid user data ({type(user)})')
+
+        self.get_user_store().save(user)
+
+        if self.hashtag_index is not None:
+            self.hashtag_index.update(user.uri, user)
+
+    def get_registered_users_count(self):
+        return self.get_user_store().get_registered_count()
+
+    def get_hashtag_index(self):
+        if self.hashtag_index is None:
+            self.logger.debug("Building hashtag index...")
+            index = hashtagindex.HashtagIndex()
+            index.build(self.get_user_store().iter_registered_users())
+            self.hashtag_index = index
+            self.logger.debug(f"Hashtag index built, {index.get_size()} users")
+        return self.hashtag_index
 
-            self.users[strk] = data
+    def get_user_today_value(self):
+        return datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d')
 
-        self.logger.debug(f"Loading done, registered: {self.registered_users} / {len(self.users)}")
+    def get_daily_counters_path(self):
+        name = f'counters.{self.identifier}.json'
+        return name
+
+    def create_daily_counters(self):
+        logger = logging.getLogger(self.identifier + '.users')
+        counters = dailycounters.DailyCounters(logger, self.get_daily_counters_path())
+        if not counters.load():
+            today = self.get_user_today_value()
+            for uri, use in self.get_user_store().iter_daily_use(today):
+                for use_identifier, count in use.items():
+                    if use_identifier != 'day' and type(count) == int:
+                        counters.add(today, use_identifier, uri, count)
+            self.logger.debug(f"Daily counters seeded, {counters.get_size()} users")
+        return counters
+
+    def get_daily_counters(self):
+        if self.daily_counters is None:
+            self.daily_counters = self.create_daily_counters()
+        return self.daily_counters
+
+    def get_user_daily_use_count(self, uri, use_identifier):
+        return self.get_daily_counters().get(self.get_user_today_value(), use_identifier, uri)
+
+    def add_user_daily_use_count(self, uri, use_identifier, count=1):
+        self.get_daily_counters().add(self.get_user_today_value(), use_identifier, uri, count)
+
+    def create_status_cache(self):
+        base_url = self.settings.instance_base_url
+        max_size = self.settings.status_cache_size
+        ttl = self.settings.status_cache_ttl
+        negative_ttl = self.settings.status_cache_negative_ttl
+        cache = statuscache.get_status_cache(urllib.parse.urlparse(base_url).netloc, max_size, ttl, negative_ttl)
+        self.log_shared_changes('Status cache', cache.configure(max_size, ttl, negative_ttl))
+        return cache
+
+    def log_shared_changes(self, name, changes):
+        # the last bot configuring an object shared per instance sets the values of all bots using it
+        if changes:
+            self.logger.info(f"{name} of {self.settings.instance_base_url} reconfigured: {', '.join(changes)}")
+
+    def get_status_cache(self):
+        if self.status_cache is None:
+            self.status_cache = self.create_status_cache()
+        return self.status_cache
+
+    def get_action_queue_path(self):
+        name = f'actions.{self.identifier}.sqlite3'
+        return name
 
-    def get_user_data(self, uri):
-        if self.users_db is None or self.users is None:
-            self.load_users_db()
+    def get_action_queue(self):
+        if self.action_queue is None:
+            queue = actionqueue.ActionQueue(logging.getLogger(self.identifier + '.actions'), self.get_action_queue_path())
+            queue.open()
+            self.action_queue = queue
+        return self.action_queue
 
-        return self.users.get(uri, {})
+    def enqueue_action(self, action, target, user_uri=None, priority=ratelimit.PRIORITY_HIGH):
+        if self.get_action_queue().push(action, target, user_uri, priority):
+            self.logger.debug(f"Queued {action} {target}")
+            self.actions_pending = True
 
-    def save_user_data(self, uri, data):
-        if type(data) != dict:
-            raise Exception(f'Invalid user data ({type(data)})')
+    def process_actions(self):
+        self.actions_pending = False
 
-        if self.users_db is None or self.users is None:
-            self.load_users_db()
+        queue = self.get_action_queue()
+        batch = self.settings.action_batch_size
 
-        self.users[uri] = data
+        for i, (action, target, user_uri, priority, attempts) in enumerate(queue.get_due(batch)):
+            if not self.check_api_rate_limit(priority):
+                break
+            if i > 0 and self.is_budget_exhausted():
+                # the rest stays due in the queue, its length is the backlog
+                self.actions_pending = True
+                self.task_paused = True
+                break
 
-        ser_data = json.dumps(data)
-        self.logger.debug(f'Saving user data {uri}: {ser_data}')
-        self.users_db[uri] = ser_data
+            try:
+                with self.get_api().priority(priority):
+                    self.run_action(action, target, user_uri)
+            except apiclient.StatusException as e:
+                if e.get_status_code() in (401, 403, 404, 422):
+                    self.logger.warning(f"Dropping {action} {target} - {e}")
+                    queue.remove(action, target)
+                else:
+                    self.retry_action(action, target, attempts, e)
+            except (OSError, http.client.HTTPException, apiclient.UnexpectedResponseException) as e:
+                self.retry_action(action, target, attempts, e)
+            else:
+                queue.remove(action, target)
+
+    def retry_action(self, action, target, attempts, e):
+        max_attempts = self.settings.action_max_attempts
+        if attempts + 1 >= max_attempts:
+            self.logger.error(f"Giving up {action} {target} after {attempts + 1} attempts - {e}")
+            self.get_action_queue().remove(action, target)
+            return
 
-    def get_user_today_value(self):
-        return datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d')
+        retry_delay = self.settings.action_retry_delay
+        delay = min(retry_delay * 2 ** attempts, 3600)
+        self.logger.warning(f"Failed {action} {target}, retrying in {delay}s - {e}")
+        self.get_action_queue().retry_later(action, target, delay)
+
+    def run_action(self, action, target, user_uri):
+        if action == 'reblog':
+            # no need to check if already reblogged: if already reblogged, does nothing and no error
+            self.get_api().reblog_status(target)
+            metrics.boosts.inc(bot=self.identifier, result='done')
+            if user_uri:
+                self.count_user_boost(user_uri)
+        elif action == 'unreblog':
+            self.get_api().unreblog_status(target)
+        elif action == 'follow':
+            self.get_api().follow_account(target)
+        elif action == 'unfollow':
+            self.get_api().unfollow_account(target)
+        elif action == 'dismiss':
+            self.get_api().dismiss_notification(target)
+        else:
+            raise Exception(f"Invalid action '{action}'")
 
-    def get_user_daily_use_count(self, user_data, use_identifier):
-        today = self.get_user_today_value()
-        use_data = user_data.get('use', {})
-        if use_data.get('day') == today:
-            count = use_data.get(use_identifier)
-            if type(count) == int:
-                return count
-        return 0
-
-    def set_user_daily_use_count(self, user_data, use_identifier, count):
-        today = self.get_user_today_value()
-        use_data = user_data.get('use', {})
-        use_data['day'] = today
-        use_data[use_identifier] = count
-        user_data['use'] = use_data
+    def count_user_boost(self, user_uri):
+        self.add_user_daily_use_count(user_uri, 'boosts')
 
     def get_status_db_path(self):
         name = f'status.{self.identifier}.db'
@@ -129,59 +378,259 @@ class BotAbstract:
         return self.status_db
 
     def get_status_value(self, key):
-        if key in self.status:
-            return self.status[key]
-        self.status[key] = self.get_status_db().get(key)
+        if key not in self.status:
+            value = self.get_status_db().get(key)
+            self.status[key] = str(value, 'utf-8') if value is not None else None
         return self.status[key]
 
     def save_status_value(self, key, value):
         self.status[key] = value
-        self.get_status_db()[key] = value
-
-    def check_api_rate_limit(self):
-        remaining = self.get_api().get_rate_limit_remaining()
-        reset_date = self.get_api().get_rate_limit_reset_date()
-        threshold = 50
-        now = datetime.datetime.now(datetime.timezone.utc)
-        if remaining is not None and reset_date and remaining < threshold and now < reset_date:
+        self.status_pending.add(key)
+
+    def flush_status(self, keys=None):
+        # keys: writes only these, for cursor checkpoints between full flushes
+        pending = self.status_pending if keys is None else self.status_pending.intersection(keys)
+        if not pending:
+            return
+
+        db = self.get_status_db()
+        for key in pending:
+            value = self.status[key]
+            if value is not None:
+                db[key] = str(value)
+            elif key in db:
+                del db[key]
+        self.status_pending = self.status_pending.difference(pending)
+
+        if hasattr(db, 'sync'):
+            db.sync()
+
+    def flush(self):
+        if self.user_store is not None:
+            with metrics.store_duration.time(bot=self.identifier, operation='user_flush'):
+                self.user_store.flush()
+        if self.daily_counters is not None:
+            with metrics.store_duration.time(bot=self.identifier, operation='counter_flush'):
+                self.daily_counters.flush()
+        with metrics.store_duration.time(bot=self.identifier, operation='status_flush'):
+            self.flush_status()
+        self.last_time_flush = time.time()
+        self.update_metrics()
+
+    def update_metrics(self):
+        if self.action_queue is not None:
+            metrics.action_queue_length.set(self.action_queue.count(), bot=self.identifier)
+        if self.status_cache is not None:
+            for stat, value in self.status_cache.get_stats().items():
+                metrics.status_cache_stats.set(value, bot=self.identifier, stat=stat)
+        if self.api is not None and self.api.pool is not None:
+            for stat, value in self.api.pool.get_stats().items():
+                metrics.connection_pool_stats.set(value, bot=self.identifier, stat=stat)
+
+    def flush_if_due(self):
+        freq = self.settings.flush_interval
+        if time.time() >= self.last_time_flush + freq:
+            self.flush()
+
+    def check_api_rate_limit(self, priority=ratelimit.PRIORITY_HIGH):
+        if not self.get_api().scheduler.can_proceed(priority):
+            remaining = self.get_api().get_rate_limit_remaining()
+            reset_date = self.get_api().get_rate_limit_reset_date()
             self.logger.info(f'API rate limit almost reached ({remaining}), waiting {reset_date}')
             return False
         return True
 
+    def run_task(self, task):
+        # returns True when the task stopped on its budget with work left
+        own_budget = self.budget is None
+        if own_budget:
+            self.budget = self.create_budget()
+        self.task_paused = False
+        try:
+            with metrics.bot_task_duration.time(bot=self.identifier, task=task.__name__):
+                task()
+        except ratelimit.RateLimitException as e:
+            self.logger.info(f'{e}, resuming on next cycle')
+        except (apiclient.StatusException, apiclient.UnexpectedResponseException, OSError,
+                http.client.HTTPException) as e:
+            # the other tasks and bots go on, this one runs again when next due
+            self.logger.error(f'{task.__name__} failed - {e}')
+        finally:
+            if own_budget:
+                self.budget = None
+        return self.task_paused
+
+    def create_budget(self):
+        return budget.CycleBudget(self.settings.cycle_time_budget, self.settings.cycle_request_budget,
+                                  self.get_api().get_request_count)
+
+    def is_budget_exhausted(self):
+        return self.budget is not None and self.budget.is_exhausted()
+
+    def set_backlog(self, source, age):
+        # type: (str, float | None) -> None
+        # None when caught up, the age of the oldest item left otherwise
+        if age is None:
+            if self.backlog.pop(source, None) is not None:
+                self.logger.info(f"Caught up on {source}")
+        else:
+            if source not in self.backlog:
+                self.logger.info(f"Backlog on {source}, {age:.0f}s behind, resuming from the stored cursor")
+            self.backlog[source] = age
+            self.task_paused = True
+        metrics.backlog_age.set(age or 0, bot=self.identifier, source=source)
+
+    def get_backlog(self):
+        return dict(self.backlog)
+
+    def get_tasks(self):
+        return []
+
+    def get_scheduled_tasks(self):
+        # (task, period in seconds) run by the app scheduler when due, without frequency checks of their own
+        return []
+
+    def get_rate_limit_delay(self):
+        return self.get_api().scheduler.get_delay(ratelimit.PRIORITY_HIGH)
+
     def process(self):
-        pass
+        if self.check_api_rate_limit():
+            # one budget for the whole cycle, tasks in priority order: commands before home boosts
+            self.budget = self.create_budget()
+            try:
+                with metrics.bot_task_duration.time(bot=self.identifier, task='cycle'):
+                    for task in self.get_tasks():
+                        self.run_task(task)
+            finally:
+                self.budget = None
+
+    def process_stream(self):
+        if not self.is_streaming_enabled():
+            return
+
+        for event, data in self.get_user_stream().get_events():
+            self.process_stream_event(event, data)
+
+    def process_stream_event(self, event, data):
+        if event == streaming.EVENT_CONNECTED:
+            # catch up on what was missed while disconnected, from the stored cursors
+            self.logger.info("Stream connected, backfilling")
+            self.do_process_notifications()
+            with self.get_api().priority(ratelimit.PRIORITY_LOW):
+                self.do_process_home()
+        elif event == 'update' and type(data) == dict:
+            self.process_stream_status(data)
+        elif event == 'notification' and type(data) == dict:
+            self.process_stream_notification(data)
+
+    def process_stream_status(self, status):
+        status_id = status.get('id')
+        last_home_status_id = self.get_status_value('last_home_id')
+        if not status_id or (last_home_status_id and int(status_id) <= int(last_home_status_id)):
+            return
+        if 'home' in self.backlog:
+            return  # paging resumes from the stored cursor and reaches it, moving the cursor would skip the gap
+
+        self.process_home_status(status)
+        self.save_status_value('last_home_id', status_id)
+
+    def process_stream_notification(self, data):
+        if data.get('id') in self.handled_notification_ids:
+            return
+
+        self.process_notification(data)
+        # behind on paging, the cursor stays for it to catch up, handled_notification_ids skips this one then
+        self.complete_notification(data, 'notifications' not in self.backlog)
 
     def process_home(self):
-        freq = self.cfg.get_config().getint(self.identifier, 'TimelineCheckFrequency')
+        freq = self.settings.timeline_check_frequency
         if time.time() > self.last_time_home_processing + freq:
+            self.run_home()
+
+    def run_home(self):
+        if self.is_stream_connected() and 'home' not in self.backlog:
+            return  # polls on until a backfill paused on its budget is done
+
+        if not self.check_api_rate_limit(ratelimit.PRIORITY_LOW):
+            return
+
+        with self.get_api().priority(ratelimit.PRIORITY_LOW):
             self.do_process_home()
-            self.last_time_home_processing = time.time()
+        self.last_time_home_processing = time.time()
 
     def do_process_home(self):
         self.logger.debug("Processing home timeline...")
 
+        limit = 40  # server maximum
+        max_pages = self.settings.home_max_pages_per_cycle
+
         last_home_status_id = self.get_status_value('last_home_id')
-        if last_home_status_id:
-            limit = 20
-            query = {'min_id': last_home_status_id, 'limit': limit}
-            while True:
-                statuses = self.get_api().get_home_timeline(query)
+        if last_home_status_id and self.is_home_backfill_too_far(last_home_status_id):
+            last_home_status_id = None
 
-                self.process_home_statuses(statuses)
+        if not last_home_status_id:
+            statuses = self.get_api().get_home_timeline({'limit': limit})
+            self.process_home_statuses(statuses)
+            self.save_status_value('home_backfill_count', 0)
+            self.flush_status(home_cursor_keys)
+            self.set_backlog('home', None)
+            return
 
-                if len(statuses) < limit:
-                    break
+        if 'notifications' in self.backlog:
+            max_pages = 1  # commands waiting, keep home progressing without taking their budget
+
+        pages = 0
+        while True:
+            query = {'min_id': last_home_status_id, 'limit': limit}
+            statuses, links = self.get_api().get_home_timeline_page(query)
 
-        else:
-            limit = 10
-            query = {'limit': limit}
-            statuses = self.get_api().get_home_timeline(query)
             self.process_home_statuses(statuses)
+            pages += 1
+
+            caught_up = len(statuses) < limit
+            backfill_count = 0 if caught_up else int(self.get_status_value('home_backfill_count') or 0) + len(statuses)
+            self.save_status_value('home_backfill_count', backfill_count)
+
+            # checkpoint, a restart resumes from this page
+            self.flush_status(home_cursor_keys)
+
+            newer_id = links.get('prev', {}).get('min_id') or self.get_status_value('last_home_id')
+            if caught_up or not newer_id or newer_id == last_home_status_id:
+                self.set_backlog('home', None)
+                break
+
+            if pages >= max_pages or self.is_budget_exhausted():
+                self.logger.debug(f"Home timeline backfill paused after {pages} pages ({backfill_count} statuses)")
+                self.set_backlog('home', get_status_id_age(self.get_status_value('last_home_id')) or 0)
+                break
+
+            if self.is_home_backfill_too_far(newer_id):
+                self.set_backlog('home', None)  # the gap is skipped, the next run starts from the latest page
+                break
+
+            last_home_status_id = newer_id
+
+    def is_home_backfill_too_far(self, last_home_status_id):
+        # type: (str) -> bool
+        max_age = self.settings.home_backfill_max_age
+        max_count = self.settings.home_backfill_max_statuses
+
+        age = get_status_id_age(last_home_status_id)
+        backfill_count = int(self.get_status_value('home_backfill_count') or 0)
+        if (age is not None and age > max_age) or backfill_count > max_count:
+            # newer statuses are fetched next, the gap is never processed
+            age_text = f'{int(age)}s' if age is not None else 'unknown age'
+            self.logger.warning(f"Home timeline too far behind ({age_text}, {backfill_count} statuses), "
+                                f"skipping gap after {last_home_status_id}")
+            self.save_status_value('last_home_id', None)
+            self.save_status_value('home_backfill_count', 0)
+            return True
+        return False
 
     def process_home_statuses(self, statuses):
         last_status_id = None
 
-        statuses.reverse()
+        statuses.sort(key=lambda s: int(s.get('id') or 0))
         for status in statuses:
             self.process_home_status(status)
             last_status_id = status.get('id')
@@ -191,14 +640,36 @@ class BotAbstract:
 
     def process_home_status(self, status):
         self.logger.debug(f"Processing status {status.get('id')} ({status.get('account', {}).get('acct')})")
+        metrics.statuses_processed.inc(bot=self.identifier)
+
+        if status.get('id'):
+            self.get_status_cache().put(status.get('id'), status)
 
     def process_notifications(self):
-        freq = self.cfg.get_config().getint(self.identifier, 'NotificationCheckFrequency')
+        freq = self.settings.notification_check_frequency
         if time.time() > self.last_time_notification_processing + freq:
-            self.do_process_notifications()
-            self.last_time_notification_processing = time.time()
+            self.run_notifications()
+
+    def run_notifications(self):
+        if self.is_stream_connected() and 'notifications' not in self.backlog:
+            return  # polls on until a backfill paused on its budget is done
+
+        self.do_process_notifications()
+        self.last_time_notification_processing = time.time()
+
+    def get_notification_fetch_mode(self):
+        return self.settings.notification_fetch_mode
+
+    def get_notification_dismiss_mode(self):
+        if self.get_notification_fetch_mode() != 'mentions':
+            return 'each'  # without a cursor, dismissing is what moves past processed notifications
+        return self.settings.notification_dismiss
 
     def do_process_notifications(self):
+        if self.get_notification_fetch_mode() == 'mentions':
+            self.do_process_mentions()
+            return
+
         self.logger.debug("Processing notifications...")
 
         limit = 10
@@ -206,35 +677,170 @@ class BotAbstract:
         while True:
             notifications = self.get_api().get_notifications(query)
 
-            for n in notifications:
-                self.process_notification(n)
-                self.dismiss_notification(n)
+            self.process_notifications_page(notifications)
 
             if len(notifications) < limit:
+                self.set_backlog('notifications', None)
                 break
 
+            if self.is_budget_exhausted():
+                # dismissed ones are gone, the next cycle starts with what is left
+                self.pause_notifications(notifications)
+                break
+
+        self.logger.debug(f"Status cache {self.get_status_cache().get_stats()}")
+        self.logger.debug(f"Connection pool {self.get_api().get_pool().get_stats()}")
+
+    def do_process_mentions(self):
+        self.logger.debug("Processing mentions...")
+
+        limit = 40
+        last_notification_id = self.get_status_value('last_notification_id')
+        while True:
+            query = [('types[]', 'mention'), ('limit', limit)]
+            query += [('exclude_types[]', t) for t in excluded_notification_types]  # servers without types[]
+            if last_notification_id:
+                query.append(('min_id', last_notification_id))
+
+            notifications, links = self.get_api().get_notifications_page(query)
+            notifications.sort(key=lambda n: int(n['id']))
+
+            self.process_notifications_page(notifications)
+
+            if not last_notification_id and notifications:
+                self.logger.info(f"No notification cursor, starting from {notifications[-1]['id']}")
+
+            newer_id = links.get('prev', {}).get('min_id')
+            if len(notifications) < limit or not newer_id:
+                self.set_backlog('notifications', None)
+                break
+
+            if self.is_budget_exhausted():
+                # resumes from last_notification_id next cycle
+                self.pause_notifications(notifications)
+                break
+            last_notification_id = newer_id
+
+        self.logger.debug(f"Status cache {self.get_status_cache().get_stats()}")
+        self.logger.debug(f"Connection pool {self.get_api().get_pool().get_stats()}")
+
+    def pause_notifications(self, notifications):
+        # the newest processed one, those left are at least as recent
+        ages = [get_created_age(n) for n in notifications]
+        age = min((a for a in ages if a is not None), default=0)
+        self.logger.debug(f"Notifications paused on cycle budget, {age:.0f}s behind")
+        self.set_backlog('notifications', age)
+
+    def process_notifications_page(self, notifications):
+        self.prefetch_notification_statuses(notifications)
+
+        for n in notifications:
+            if n['id'] in self.handled_notification_ids:
+                # already handled from the stream while paging was behind
+                self.save_notification_cursor(n['id'])
+                continue
+            self.process_notification(n)
+            self.complete_notification(n)
+
+    def complete_notification(self, data, move_cursor=True):
+        notif_id = data['id']
+        metrics.notifications_processed.inc(bot=self.identifier)
+
+        if self.get_notification_dismiss_mode() == 'each':
+            if self.get_notification_fetch_mode() == 'mentions':
+                self.enqueue_action('dismiss', notif_id)
+            else:
+                # this query has no cursor, dismissing is what moves past processed notifications
+                self.dismiss_notification(data)
+
+        if move_cursor:
+            self.save_notification_cursor(notif_id)
+
+        # the same notification may come from both the stream and a backfill poll
+        self.handled_notification_ids[notif_id] = True
+        if len(self.handled_notification_ids) > 1000:
+            self.handled_notification_ids.popitem(last=False)
+
+    def save_notification_cursor(self, notif_id):
+        last_notification_id = self.get_status_value('last_notification_id')
+        if not last_notification_id or int(notif_id) > int(last_notification_id):
+            self.save_status_value('last_notification_id', notif_id)
+
     def process_notification(self, data):
         pass
 
+    def get_notification_parent_status_id(self, data):
+        return None
+
+    def prefetch_notification_statuses(self, notifications):
+        status_ids = []
+        for n in notifications:
+            parent_status_id = self.get_notification_parent_status_id(n)
+            if parent_status_id:
+                status_ids.append(str(parent_status_id))
+        self.prefetch_statuses(status_ids)
+
+    def prefetch_statuses(self, status_ids):
+        cache = self.get_status_cache()
+        missing = [status_id for status_id in dict.fromkeys(status_ids) if not cache.has(status_id)]
+        if not missing:
+            return
+
+        self.logger.debug(f"Prefetching {len(missing)} statuses")
+
+        if self.multi_statuses_supported:
+            try:
+                for i in range(0, len(missing), 20):
+                    chunk = missing[i:i + 20]
+                    statuses = self.get_api().get_statuses(chunk)
+                    for status in statuses:
+                        cache.put(status.get('id'), status)
+
+                    found = {str(status.get('id')) for status in statuses}
+                    for status_id in chunk:
+                        if status_id not in found:
+                            cache.put_missing(status_id)
+                return
+            except apiclient.StatusException as e:
+                if e.get_status_code() != 404:
+                    raise e
+                self.logger.info("Multiple statuses endpoint not supported, fetching one by one")
+                self.multi_statuses_supported = False
+
+        workers = self.settings.prefetch_concurrency
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(missing))) as executor:
+            list(executor.map(self.get_parent_status_safe, missing))
+
     def dismiss_notification(self, data):
         notif_id = data['id']
         self.logger.info(f"Dismissing notification {notif_id} ({data.get('type')})")
         self.get_api().dismiss_notification(notif_id)
 
     def get_parent_status_safe(self, parent_status_id):
+        cache = self.get_status_cache()
+        hit, status = cache.get(parent_status_id)
+        if hit:
+            return status
+
         try:
-            return self.get_api().get_status(parent_status_id)
+            status = self.get_api().get_status(parent_status_id)
         except apiclient.StatusException as e:
             if e.get_status_code() in (401, 404):
                 self.logger.warning(f"Failed to get parent status {parent_status_id} - {e}")
+                cache.put_missing(parent_status_id)
                 return None
             raise e
 
-    def check_user_daily_boost_count(self, uri, user_data):
-        use = self.get_user_daily_use_count(user_data, 'boosts')
-        boost_limit = self.cfg.get_config().getint(self.identifier, 'BoostLimit')
+        cache.put(parent_status_id, status)
+        return status
+
+    def check_user_daily_boost_count(self, uri):
+        # queued boosts count as used, the counter itself only moves when a boost is done
+        use = self.get_user_daily_use_count(uri, 'boosts') + self.get_action_queue().count_user('reblog', uri)
+        boost_limit = self.settings.boost_limit
         if use >= boost_limit:
             self.logger.info(f"Boost limit reached {uri} - {use}/{boost_limit}")
+            metrics.boosts.inc(bot=self.identifier, result='refused_limit')
             return -1
         return use
 
@@ -249,59 +855,198 @@ class BotAbstract:
 
         self.logger.info(f"Canceling boost {parent_status_id} (user {user_uri})")
 
-        self.get_api().unreblog_status(parent_status_id)
+        self.enqueue_action('unreblog', parent_status_id, user_uri)
 
-    def register_command(self, user_uri, user_data, status):
+    def register_command(self, user_uri, user, status):
         user_id = status.get('account', {}).get('id')
         if not user_id:
             return
 
-        limit = self.cfg.get_config().getint(self.identifier, 'UserLimit')
-        if self.registered_users > limit:
+        limit = self.settings.user_limit
+        if self.get_registered_users_count() > limit:
             self.logger.warning(f"User limit reached {limit}")
             return
 
         self.logger.info(f"Following user {user_uri}")
-        self.get_api().follow_account(user_id)
+        self.enqueue_action('follow', user_id, user_uri)
 
         hashtags = []
         status_tags = status.get('tags', [])
         for tag in status_tags:
             tag_name = tag.get('name')
             if tag_name:
-                hashtags.append(tag_name)
+                hashtags.append(sys.intern(tag_name))
 
-        user_data['boost'] = True
-        user_data['hashtags'] = hashtags
-        self.save_user_data(user_uri, user_data)
-        self.registered_users += 1
+        user.boost = True
+        user.hashtags = tuple(hashtags)
+        user.account_id = str(user_id)
+        self.save_user(user)
 
-    def stop_command(self, user_uri, user_data, status):
+    def stop_command(self, user_uri, user, status):
         user_id = status.get('account', {}).get('id')
         if not user_id:
             return
 
         self.logger.info(f"Unfollowing user {user_uri}")
-        self.get_api().unfollow_account(user_id)
-
-        user_data['boost'] = False
-        self.save_user_data(user_uri, user_data)
-        self.registered_users -= 1
+        self.enqueue_action('unfollow', user_id, user_uri)
+
+        user.boost = False
+        self.save_user(user)
+
+    def get_account_id(self):
+        account_id = self.get_status_value('account_id')
+        if not account_id:
+            account_id = str(self.get_api().verify_credentials().get('id', ''))
+            if not account_id:
+                raise Exception("No account id in credentials")
+            self.save_status_value('account_id', account_id)
+        return account_id
+
+    def run_reconcile(self):
+        # follows the registered users, checkpointed in the status db so a pass spans many cycles:
+        # 'following': unfollows stopped and blocked users found in the following list
+        # 'relationships': follows registered users that are not followed anymore
+        phase = self.get_status_value('reconcile_phase')
+        if not phase:
+            last_time = float(self.get_status_value('reconcile_time') or 0)
+            if time.time() < last_time + self.settings.reconcile_interval:
+                return
+            self.logger.info("Follow reconciliation started")
+            phase = 'following'
+            self.save_status_value('reconcile_phase', phase)
+            self.save_status_value('reconcile_cursor', None)
+
+        with self.get_api().priority(ratelimit.PRIORITY_LOW):
+            for _ in range(self.settings.reconcile_pages_per_cycle):
+                if not self.check_api_rate_limit(ratelimit.PRIORITY_LOW):
+                    break
 
-    def has_status_hashtag(self, status, hashtags):
-        status_tags = status.get('tags', [])
-        if len(status_tags) > 0:
-            if len(hashtags) == 0:
-                return True  # empty list = any hashtags
+                cursor = self.get_status_value('reconcile_cursor')
+                if phase == 'following':
+                    cursor = self.reconcile_following_page(cursor)
+                    if cursor is None:
+                        phase = 'relationships'
+                        self.reconcile_uris = None
+                else:
+                    cursor = self.reconcile_relationships_page(cursor)
+                    if cursor is None:
+                        phase = None
+                        self.reconcile_uris = None
+                        self.save_status_value('reconcile_time', time.time())
+                        self.logger.info("Follow reconciliation done")
+
+                self.save_status_value('reconcile_phase', phase)
+                self.save_status_value('reconcile_cursor', cursor)
+                if phase is None:
+                    break
 
-            for tag in status_tags:
-                tag_name = tag.get('name')
-                if tag_name in hashtags:
-                    return True
+    def reconcile_following_page(self, cursor):
+        # returns the next page cursor, None at the end of the list
+        query = {'limit': 80}  # server maximum
+        if cursor:
+            query['max_id'] = cursor
+        accounts, links = self.get_api().get_following_page(self.get_account_id(), query)
+
+        store = self.get_user_store()
+        for account in accounts:
+            uri = account.get('uri')
+            account_id = account.get('id')
+            if type(uri) != str or not account_id:
+                continue
+
+            user = self.get_user(uri)
+            if user.boost and not user.blocked:
+                if user.account_id != account_id:
+                    user.account_id = account_id
+                    self.save_user(user)
+                continue
+
+            if not self.settings.reconcile_unfollow_unknown and not store.has(uri):
+                continue  # followed outside of the bot
+
+            self.logger.info(f"Reconcile: unfollowing {uri}, not registered")
+            metrics.reconcile_corrections.inc(bot=self.identifier, action='unfollow')
+            self.enqueue_action('unfollow', account_id, uri, ratelimit.PRIORITY_LOW)
+
+        if not accounts:
+            return None
+        return links.get('next', {}).get('max_id')
+
+    def reconcile_relationships_page(self, cursor):
+        # pages a sorted snapshot of registered users, the cursor is the last uri checked
+        if self.reconcile_uris is None:
+            self.reconcile_uris = sorted(self.get_hashtag_index().get_users())
+        uris = self.reconcile_uris
+
+        limit = 40  # ids per relationships request
+        users = []
+        i = bisect.bisect_right(uris, cursor) if cursor else 0
+        end = min(i + limit * 10, len(uris))  # bounds store reads when many users have no known id
+        while i < end and len(users) < limit:
+            user = self.get_user(uris[i])
+            i += 1
+            if user.boost and not user.blocked and user.account_id:
+                users.append(user)
+
+        if users:
+            relationships = self.get_api().get_relationships([user.account_id for user in users])
+            following = {r.get('id'): bool(r.get('following') or r.get('requested')) for r in relationships}
+            for user in users:
+                if following.get(user.account_id) is False:
+                    self.logger.info(f"Reconcile: following {user.uri}, registered")
+                    metrics.reconcile_corrections.inc(bot=self.identifier, action='follow')
+                    self.enqueue_action('follow', user.account_id, user.uri, ratelimit.PRIORITY_LOW)
+
+        if i >= len(uris):
+            return None
+        return uris[i - 1]
+
+    def create_command_dispatcher(self):
+        ignore_case = self.settings.command_ignore_case
+        return commands.CommandDispatcher(ignore_case)
+
+    def get_command_dispatcher(self):
+        if self.command_dispatcher is None:
+            self.command_dispatcher = self.create_command_dispatcher()
+        return self.command_dispatcher
 
     def get_status_content(self, status):
-        return self.content_parser.get_content_text(status.get('content'))
+        return self.content_parser.get_status_text(status)
 
     def get_status_content_without_mentions(self, status):
-        return re.sub(re_clear_mentions, '', self.get_status_content(status))
-
+        text = self.content_parser.get_status_text(status, skip_mentions=True)
+        # mention links are dropped by the parser, this only catches plain text ones
+        if '@' in text:
+            text = re.sub(re_clear_mentions, '', text)
+        return text
+
+
+def get_created_age(data):
+    # type: (dict) -> float | None
+    value = data.get('created_at')
+    if type(value) != str:
+        return None
+    # "Z" not supported in python 3.10
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    try:
+        created = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=datetime.timezone.utc)
+    return max(time.time() - created.timestamp(), 0)
+
+
+def get_status_id_age(status_id):
+    # type: (str) -> float | None
+    # mastodon ids are snowflakes: milliseconds since epoch in the high bits
+    try:
+        timestamp = (int(status_id) >> 16) / 1000
+    except (ValueError, TypeError):
+        return None
+
+    now = time.time()
+    if timestamp < 1483228800 or timestamp > now + 86400:  # not a snowflake id
+        return None
+    return now - timestamp
@@ -1,17 +1,31 @@
 import botabstract
-import re
-
-re_register_command = re.compile(r'\bboost\b')
-re_stop_command = re.compile(r'\bstop\b')
-re_cancel_command = re.compile(r'\bcancel\b')
+import metrics
+import ratelimit
+import settings
 
 
 class BotAutoShareTags(botabstract.BotAbstract):
 
-    def process(self):
-        if self.check_api_rate_limit():
-            self.process_notifications()
-            self.process_home()
+    def get_tasks(self):
+        return [self.process_stream, self.process_notifications, self.process_home, self.process_actions]
+
+    def get_setting_definitions(self):
+        # CommandRegister = boost, partager, teilen
+        return super().get_setting_definitions() + [
+            settings.Setting('CommandRegister', 'list', ['boost'], reset='commands'),
+            settings.Setting('CommandStop', 'list', ['stop'], reset='commands'),
+            settings.Setting('CommandCancel', 'list', ['cancel'], reset='commands'),
+        ]
+
+    def get_scheduled_tasks(self):
+        tasks = [(self.run_notifications, self.settings.notification_check_frequency),
+                 (self.run_home, self.settings.timeline_check_frequency),
+                 (self.process_actions, self.settings.action_check_frequency)]
+        if self.is_streaming_enabled():
+            tasks.insert(0, (self.process_stream, 1))
+        if self.settings.reconcile:
+            tasks.append((self.run_reconcile, self.settings.reconcile_check_frequency))
+        return tasks
 
     def process_notification(self, data):
         if data.get('type') != 'mention':
@@ -19,29 +33,68 @@ class BotAutoShareTags(botabstract.BotAbstract):
 
         status = data.get('status', {})
         parent_status_id = status.get('in_reply_to_id', None)
-        text = self.get_status_content_without_mentions(status)
 
         user_uri = status.get('account', {}).get('uri')
         if type(user_uri) != str:
             return False
 
-        user_data = self.get_user_data(user_uri)
-        if user_data.get('blocked', False):
+        user = self.get_user(user_uri)
+        if user.blocked:
             return False
 
-        if re_register_command.search(text):
-            self.register_command(user_uri, user_data, status)
-        elif re_stop_command.search(text):
-            self.stop_command(user_uri, user_data, status)
-        elif parent_status_id:
-            if re_cancel_command.search(text):
-                self.cancel_boost_parent(parent_status_id, user_uri)
-            else:
-                self.boost_parent(parent_status_id, user_uri, user_data)
+        handler = self.get_command_handlers().get(self.get_command(status))
+        if handler is not None:
+            handler(user_uri, user, status, parent_status_id)
+
+    def create_command_dispatcher(self):
+        # precedence: register > stop > cancel, a reply without keyword is a boost request
+        dispatcher = super().create_command_dispatcher()
+        dispatcher.register('register', self.settings.command_register, 0)
+        dispatcher.register('stop', self.settings.command_stop, 1)
+        dispatcher.register('cancel', self.settings.command_cancel, 2, reply=True)
+        dispatcher.register('boost', [], 3, reply=True)
+        dispatcher.set_reply_default('boost')
+        return dispatcher
+
+    def get_command_handlers(self):
+        # command name -> handler(user_uri, user, status, parent_status_id)
+        return {
+            'register': self.handle_register_command,
+            'stop': self.handle_stop_command,
+            'cancel': self.handle_cancel_command,
+            'boost': self.handle_boost_command,
+        }
+
+    def handle_register_command(self, user_uri, user, status, parent_status_id):
+        self.register_command(user_uri, user, status)
+
+    def handle_stop_command(self, user_uri, user, status, parent_status_id):
+        self.stop_command(user_uri, user, status)
+
+    def handle_cancel_command(self, user_uri, user, status, parent_status_id):
+        self.cancel_boost_parent(parent_status_id, user_uri)
+
+    def handle_boost_command(self, user_uri, user, status, parent_status_id):
+        self.boost_parent(parent_status_id, user_uri)
+
+    def get_notification_parent_status_id(self, data):
+        if data.get('type') != 'mention':
+            return None
 
-    def boost_parent(self, parent_status_id, user_uri, user_data):
+        status = data.get('status', {})
+        command = self.get_command_dispatcher().get(self.get_command(status))
+        if command is not None and command.reply:
+            return status.get('in_reply_to_id')
+        return None
 
-        use = self.check_user_daily_boost_count(user_uri, user_data)
+    def get_command(self, status):
+        text = self.get_status_content_without_mentions(status)
+        command, position = self.get_command_dispatcher().match(text, bool(status.get('in_reply_to_id', None)))
+        return command
+
+    def boost_parent(self, parent_status_id, user_uri):
+
+        use = self.check_user_daily_boost_count(user_uri)
         if use == -1:
             return
 
@@ -52,20 +105,17 @@ class BotAutoShareTags(botabstract.BotAbstract):
         # this bot is intended to increase public/indexable content on an instance
         # so boost only public posts in this bot
         if parent_status.get('visibility') != 'public':
+            metrics.boosts.inc(bot=self.identifier, result='refused_visibility')
             return
 
         parent_user_uri = parent_status.get('account', {}).get('uri')
         if parent_user_uri != user_uri:
+            metrics.boosts.inc(bot=self.identifier, result='refused_owner')
             return
 
         self.logger.info(f"Boosting status {parent_status_id} (user {user_uri})")
 
-        # no need to check if already reblogged: if already reblogged, does nothing and no error
-        self.get_api().reblog_status(parent_status_id)
-
-        use += 1
-        self.set_user_daily_use_count(user_data, 'boosts', use)
-        self.save_user_data(user_uri, user_data)
+        self.enqueue_action('reblog', parent_status_id, user_uri)
 
     def process_home_status(self, status):
         super().process_home_status(status)
@@ -78,22 +128,19 @@ class BotAutoShareTags(botabstract.BotAbstract):
         if type(user_uri) != str or not status_id:
             return
 
-        user_data = self.get_user_data(user_uri)
-        if user_data.get('blocked', False) or not user_data.get('boost', False):
+        # drop statuses of unregistered users or without matching hashtags before loading the user
+        if not self.get_hashtag_index().match(user_uri, status.get('tags', [])):
             return
 
-        if not self.has_status_hashtag(status, user_data.get('hashtags')):
+        user = self.get_user(user_uri)
+        if user.blocked or not user.boost:
             return
 
-        use = self.check_user_daily_boost_count(user_uri, user_data)
+        use = self.check_user_daily_boost_count(user_uri)
         if use == -1:
             return
 
         self.logger.info(f"Boosting home status {status_id} (user {user_uri})")
 
-        self.get_api().reblog_status(status_id)
-
-        use += 1
-        self.set_user_daily_use_count(user_data, 'boosts', use)
-        self.save_user_data(user_uri, user_data)
+        self.enqueue_action('reblog', status_id, user_uri, ratelimit.PRIORITY_LOW)
 
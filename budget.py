@@ -0,0 +1,27 @@
+import time
+
+
+class CycleBudget:
+    # time and request allowance of a bot cycle: paging stops when it runs out, stored cursors resume it next cycle
+    def __init__(self, seconds=0, requests=0, request_count=None):
+        self.seconds = seconds  # 0 = unlimited
+        self.requests = requests  # 0 = unlimited
+        self.request_count = request_count  # callable, requests sent so far
+
+        self.start_time = time.monotonic()
+        self.start_requests = request_count() if request_count else 0
+
+    def get_used_requests(self):
+        if self.request_count is None:
+            return 0
+        return self.request_count() - self.start_requests
+
+    def get_elapsed(self):
+        return time.monotonic() - self.start_time
+
+    def is_exhausted(self):
+        if self.seconds and self.get_elapsed() >= self.seconds:
+            return True
+        if self.requests and self.get_used_requests() >= self.requests:
+            return True
+        return False
@@ -0,0 +1,79 @@
+import re
+
+
+class Command:
+    def __init__(self, name, keywords, precedence, reply=False):
+        self.name = name
+        self.keywords = [k for k in keywords if k]
+        self.precedence = precedence  # lower wins when several commands appear in a text
+        self.reply = reply  # only valid in a reply, acts on the replied-to status
+
+
+class CommandDispatcher:
+    # all keywords in a single alternation: one scan of the text whatever the number of commands and languages
+    def __init__(self, ignore_case=False):
+        self.ignore_case = ignore_case
+
+        self.commands = {}  # type: dict[str, Command]
+        self.reply_default = None
+        self.matcher = None
+        self.compiled = False
+        self.group_commands = {}
+        self.top_precedence = None
+
+    def register(self, name, keywords, precedence, reply=False):
+        self.commands[name] = Command(name, keywords, precedence, reply)
+        self.compiled = False
+
+    def set_reply_default(self, name):
+        # command of a reply without any keyword
+        self.reply_default = name
+
+    def get(self, name):
+        # type: (str) -> Command | None
+        return self.commands.get(name)
+
+    def compile(self):
+        alternatives = []
+        self.group_commands = {}
+        for i, command in enumerate(sorted(self.commands.values(), key=lambda c: c.precedence)):
+            if not command.keywords:
+                continue
+            group = f'c{i}'
+            self.group_commands[group] = command
+            # longest first, "boosts" must not stop at "boost"
+            keywords = sorted(command.keywords, key=len, reverse=True)
+            alternatives.append(f'(?P<{group}>' + '|'.join(re.escape(k) for k in keywords) + ')')
+
+        if not alternatives:
+            return None
+
+        self.top_precedence = min(command.precedence for command in self.group_commands.values())
+
+        flags = re.IGNORECASE if self.ignore_case else 0
+        return re.compile(r'(?<!\w)(?:' + '|'.join(alternatives) + r')(?!\w)', flags)
+
+    def match(self, text, is_reply=False):
+        # type: (str, bool) -> tuple[str | None, int]
+        if not self.compiled:
+            self.matcher = self.compile()
+            self.compiled = True
+
+        best = None
+        best_pos = -1
+        if self.matcher is not None:
+            for m in self.matcher.finditer(text):
+                command = self.group_commands[m.lastgroup]
+                if command.reply and not is_reply:
+                    continue
+                if best is None or command.precedence < best.precedence:
+                    best = command
+                    best_pos = m.start()
+                    if command.precedence == self.top_precedence:
+                        break
+
+        if best is None:
+            if is_reply and self.reply_default:
+                return self.reply_default, -1
+            return None, -1
+        return best.name, best_pos
@@ -7,12 +7,26 @@ class Config:
         self.path = path
 
         self.config = None
+        self.mtime = None
 
     def create_config(self):
+        self.mtime = get_mtime(self.path)
         config = configparser.ConfigParser()
-        config.read(self.path)
+        # read() skips missing files, a config being replaced must not read as one without any bot
+        with open(self.path, encoding='utf-8') as f:
+            config.read_file(f)
+        if not config.sections():
+            raise Exception(f'{self.path} has no sections')
         return config
 
+    def reload_if_changed(self, force=False):
+        # type: (bool) -> bool
+        # missing, empty or invalid files leave the current config in place
+        if not force and self.config is not None and get_mtime(self.path) == self.mtime:
+            return False
+        self.config = self.create_config()
+        return True
+
     def get_config(self):
         if self.config is None:
             self.config = self.create_config()
@@ -26,3 +40,10 @@ class Config:
             value = os.environ.get(value[len(env_prefix):])
 
         return value
+
+
+def get_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,104 @@
+import http.client
+import threading
+import time
+import urllib.parse
+
+pools = {}
+pools_lock = threading.Lock()
+
+idempotent_methods = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+stale_connection_errors = (http.client.RemoteDisconnected, http.client.CannotSendRequest, BrokenPipeError,
+                           ConnectionResetError, ConnectionAbortedError)
+
+
+class ConnectionPool:
+    def __init__(self, base_url, max_size=4, idle_timeout=60, timeout=30):
+        self.base_url = base_url
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout  # socket timeout, a stalled server fails the request instead of hanging the worker
+
+        self.idle = []  # (connection, last use time), most recently used last
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.failed = 0
+
+    def configure(self, max_size, idle_timeout, timeout):
+        # type: (int, float, float) -> list[str]
+        values = {'max_size': max_size, 'idle_timeout': idle_timeout, 'timeout': timeout}
+        with self.lock:
+            changes = [f'{name} {getattr(self, name)} -> {value}' for name, value in values.items()
+                       if getattr(self, name) != value]
+            for name, value in values.items():
+                setattr(self, name, value)
+            surplus = self.idle[:-max_size]
+            self.idle = self.idle[-max_size:]
+
+        for conn, last_use in surplus:
+            conn.close()
+        return changes
+
+    def get(self):
+        # type: () -> tuple[http.client.HTTPConnection, bool]
+        now = time.monotonic()
+        with self.lock:
+            while self.idle:
+                conn, last_use = self.idle.pop()
+                if now - last_use < self.idle_timeout:
+                    self.reused += 1
+                    return conn, True
+                conn.close()
+
+            self.opened += 1
+
+        return create_conn(self.base_url, self.timeout), False
+
+    def put(self, conn):
+        with self.lock:
+            if len(self.idle) < self.max_size:
+                self.idle.append((conn, time.monotonic()))
+                return
+
+        conn.close()
+
+    def discard(self, conn):
+        with self.lock:
+            self.failed += 1
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+
+        for conn, last_use in idle:
+            conn.close()
+
+    def get_stats(self):
+        return {'idle': len(self.idle), 'opened': self.opened, 'reused': self.reused, 'failed': self.failed}
+
+
+def create_conn(base_url, timeout=None):
+    o = urllib.parse.urlparse(base_url)
+    kwargs = {}
+    if timeout is not None:
+        kwargs['timeout'] = timeout
+    if o.scheme == 'http':
+        c = http.client.HTTPConnection(o.netloc, **kwargs)
+    else:
+        c = http.client.HTTPSConnection(o.netloc, **kwargs)
+    return c
+
+
+def get_pool(base_url, max_size=4, idle_timeout=60, timeout=30):
+    # shared by all bots of the same instance, created with the values of the first one, configure applies those of
+    # the others
+    o = urllib.parse.urlparse(base_url)
+    key = (o.scheme, o.netloc)
+    with pools_lock:
+        pool = pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(f'{o.scheme}://{o.netloc}/', max_size, idle_timeout, timeout)
+            pools[key] = pool
+        return pool
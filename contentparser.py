@@ -1,24 +1,127 @@
 # coding=utf-8
 
+import collections
+import html
+import re
 from html.parser import HTMLParser
 
+# tags found in mastodon status html, anything else goes through HTMLParser
+fast_tags = ('p', 'br', 'a', 'span')
+newline_tags = ('p', 'div', 'br', 'h1', 'h2', 'h3')
+
+re_tag = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9]*)([^<>]*)>')
+re_class = re.compile(r'''\sclass\s*=\s*(?:"([^"]*)"|'([^']*)')''')
+
 
 class ContentParser(HTMLParser):
 
-    def __init__(self, **kwargs):
-        self.t = ''
+    def __init__(self, memo_size=1000, **kwargs):
+        self.chunks = []
+        self.skip_mentions = False
+        self.mention_depth = 0
+        self.memo_size = memo_size
+        self.memo = collections.OrderedDict()
         super().__init__(**kwargs)
 
+    def handle_starttag(self, tag, attrs):
+        if self.skip_mentions and tag == 'a':
+            if self.mention_depth or is_mention_class(dict(attrs).get('class')):
+                self.mention_depth += 1
+
     def handle_endtag(self, tag):
-        if tag.lower() in ('p', 'div', 'br', 'h1', 'h2', 'h3'):
-            self.t += '\n'
+        if tag == 'a' and self.mention_depth:
+            self.mention_depth -= 1
+        if tag.lower() in newline_tags:
+            self.chunks.append('\n')
 
     def handle_data(self, data):
-        self.t += data
+        if not self.mention_depth:
+            self.chunks.append(data)
+
+    def get_content_text(self, content, skip_mentions=False):
+        text = extract_text(content, skip_mentions)
+        if text is None:
+            text = self.parse_content_text(content, skip_mentions)
+        return text
 
-    def get_content_text(self, content):
+    def parse_content_text(self, content, skip_mentions=False):
         self.reset()
-        self.t = ''
+        self.chunks = []
+        self.skip_mentions = skip_mentions
+        self.mention_depth = 0
         self.feed(content)
-        return self.t
+        self.close()
+        return ''.join(self.chunks)
+
+    def get_status_text(self, status, skip_mentions=False):
+        # statuses only change when edited, the same status comes back through stream, notifications and home
+        status_id = status.get('id')
+        if not status_id or not self.memo_size:
+            return self.get_content_text(status.get('content') or '', skip_mentions)
+
+        key = (status_id, status.get('edited_at'), skip_mentions)
+        text = self.memo.get(key)
+        if text is None:
+            text = self.get_content_text(status.get('content') or '', skip_mentions)
+            self.memo[key] = text
+            if len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+        else:
+            self.memo.move_to_end(key)
+        return text
+
+
+def extract_text(content, skip_mentions=False):
+    # type: (str, bool) -> str | None
+    # single pass over the mastodon subset, None when the markup needs the full parser
+    chunks = []
+    pos = 0
+    mention_depth = 0
+    for m in re_tag.finditer(content):
+        data = content[pos:m.start()]
+        if '<' in data:
+            return None
+        if data and not mention_depth:
+            chunks.append(html.unescape(data) if '&' in data else data)
+        pos = m.end()
+
+        closing, tag, attrs = m.groups()
+        tag = tag.lower()
+        if tag not in fast_tags or (attrs and not attrs[0].isspace() and attrs != '/'):
+            return None
+        if attrs.count('"') % 2 or attrs.count("'") % 2:
+            return None
+        self_closing = attrs.endswith('/')
+
+        if not closing and tag == 'a' and skip_mentions and (mention_depth or is_mention_class(get_class(attrs))):
+            mention_depth += 1
+
+        # like HTMLParser: a self-closing tag is a start tag followed by an end tag
+        if closing or self_closing:
+            if tag == 'a' and mention_depth:
+                mention_depth -= 1
+            if tag in newline_tags:
+                chunks.append('\n')
+
+    data = content[pos:]
+    if '<' in data:
+        return None
+    if data and not mention_depth:
+        chunks.append(html.unescape(data) if '&' in data else data)
+
+    return ''.join(chunks)
+
+
+def get_class(attrs):
+    m = re_class.search(attrs)
+    if m is None:
+        return None
+    return html.unescape(m.group(1) if m.group(1) is not None else m.group(2))
+
 
+def is_mention_class(value):
+    # mention links are "u-url mention", hashtag links "mention hashtag" and keep their text
+    if not value:
+        return False
+    classes = value.split()
+    return 'mention' in classes and 'hashtag' not in classes
@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+import sys
+
+
+class DailyCounters:
+    # one table per day: a new day swaps in an empty table, nothing to check or clear per user
+    def __init__(self, logger, path):
+        self.logger = logger  # type: logging.Logger
+        self.path = path
+
+        self.day = None
+        self.counts = {}  # type: dict[str, dict[str, int]]  counter name -> user uri -> count
+        self.dirty = False
+
+    def load(self):
+        # False when there is nothing usable on disk yet
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            self.logger.error(f'Invalid daily counters {self.path}, resetting - {e}')
+            return False
+
+        if type(data) != dict or type(data.get('counts')) != dict:
+            self.logger.error(f'Invalid daily counters {self.path}, resetting')
+            return False
+
+        self.day = data.get('day')
+        self.counts = {}
+        for name, users in data['counts'].items():
+            self.counts[name] = {sys.intern(uri): count for uri, count in users.items() if type(count) == int}
+        return True
+
+    def set_day(self, day):
+        if day != self.day:
+            self.day = day
+            self.counts = {}
+            self.dirty = True
+
+    def get(self, day, name, uri):
+        self.set_day(day)
+        users = self.counts.get(name)
+        if users is None:
+            return 0
+        return users.get(uri, 0)
+
+    def add(self, day, name, uri, count=1):
+        self.set_day(day)
+        users = self.counts.setdefault(name, {})
+        uri = sys.intern(uri)
+        users[uri] = users.get(uri, 0) + count
+        self.dirty = True
+
+    def flush(self):
+        if not self.dirty:
+            return
+
+        self.dirty = False
+        # written whole, only users active today are in it
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'day': self.day, 'counts': self.counts}, f)
+        os.replace(tmp_path, self.path)
+
+    def get_size(self):
+        return sum(len(users) for users in self.counts.values())
@@ -0,0 +1,66 @@
+import sys
+import userstore
+
+
+class HashtagIndex:
+    def __init__(self):
+        self.tag_users = {}  # type: dict[str, set[str]]
+        self.any_tag_users = set()
+        self.user_tags = {}  # type: dict[str, tuple[str, ...]]
+
+    def build(self, users):
+        for uri, record in users:
+            self.update(uri, record)
+
+    def update(self, uri, record):
+        # type: (str, userstore.UserRecord) -> None
+        self.remove(uri)
+
+        if record.blocked or not record.boost:
+            return
+
+        uri = record.uri  # interned, shared by every set below
+        if not record.hashtags:
+            self.any_tag_users.add(uri)  # empty list = any hashtags
+            return
+
+        tags = tuple({normalize_tag(tag) for tag in record.hashtags})
+        for tag in tags:
+            self.tag_users.setdefault(tag, set()).add(uri)
+        self.user_tags[uri] = tags
+
+    def remove(self, uri):
+        self.any_tag_users.discard(uri)
+
+        for tag in self.user_tags.pop(uri, ()):
+            users = self.tag_users[tag]
+            users.discard(uri)
+            if not users:
+                del self.tag_users[tag]
+
+    def match(self, uri, status_tags):
+        if not status_tags:
+            return False
+
+        if uri in self.any_tag_users:
+            return True
+
+        for tag in status_tags:
+            tag_name = tag.get('name')
+            if tag_name:
+                users = self.tag_users.get(normalize_tag(tag_name))
+                if users and uri in users:
+                    return True
+
+        return False
+
+    def get_users(self):
+        # registered users that are not blocked
+        return list(self.any_tag_users) + list(self.user_tags)
+
+    def get_size(self):
+        return len(self.any_tag_users) + len(self.user_tags)
+
+
+def normalize_tag(name):
+    return sys.intern(name.casefold())
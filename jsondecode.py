@@ -0,0 +1,51 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DecodeError = (ValueError, UnicodeDecodeError)  # json.JSONDecodeError and orjson.JSONDecodeError are ValueError
+
+account_fields = ('id', 'uri', 'acct')
+status_fields = ('id', 'visibility', 'tags', 'content', 'in_reply_to_id', 'created_at', 'edited_at')
+
+
+def get_backend_name():
+    return 'orjson' if orjson is not None else 'json'
+
+
+def loads(data):
+    # type: (bytes) -> object
+    # parses utf-8 bytes directly, without an intermediate str copy when orjson is available
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def project_status(status):
+    # keep only what the bots read, full statuses are the largest objects we keep around
+    if type(status) != dict:
+        return status
+
+    projected = {k: status[k] for k in status_fields if k in status}
+
+    account = status.get('account')
+    if type(account) == dict:
+        projected['account'] = {k: account[k] for k in account_fields if k in account}
+
+    tags = projected.get('tags')
+    if type(tags) == list:
+        projected['tags'] = [{'name': tag.get('name')} for tag in tags if type(tag) == dict]
+
+    return projected
+
+
+def project_notification(notification):
+    if type(notification) != dict:
+        return notification
+
+    projected = {k: notification[k] for k in ('id', 'type') if k in notification}
+    if 'status' in notification:
+        projected['status'] = project_status(notification['status'])
+    return projected
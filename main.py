@@ -3,24 +3,65 @@
 
 import app
 import argparse
+import supervisor
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Starts bot processing loop')
-    parser.add_argument('identifiers', nargs='+',
+    parser.add_argument('identifiers', nargs='*',
                         help='list of bot identifiers')
+    parser.add_argument('--all', dest='all_bots', action='store_true',
+                        help='run every config.ini section with a Type, following sections added or removed later')
     parser.add_argument('--no-loop', action='store_true',
                         help='do processing once and exit')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='schedule each bot task on an asyncio event loop, running them concurrently in threads')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='max number of bot tasks running at the same time in async mode')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='split bots across this many worker processes, restarted when they crash')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve Prometheus metrics on this local port (workers use port + worker index)')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='address the metrics endpoint listens on')
+    parser.add_argument('--metrics-interval', type=float, default=300,
+                        help='seconds between metrics summary log lines, 0 to disable')
+    parser.add_argument('--config-check-interval', type=float, default=10,
+                        help='seconds between config.ini change checks, 0 to reload on SIGHUP only')
+    parser.add_argument('--profile-dir', default='.',
+                        help='where SIGUSR1 cProfile and SIGUSR2 tracemalloc reports are written')
+    parser.add_argument('--profile-cycles', type=int, default=10,
+                        help='bot cycles covered by a SIGUSR1 cProfile')
 
     args = parser.parse_args()
+    if not args.identifiers and not args.all_bots:
+        parser.error('no bot identifiers, list some or use --all')
 
     a = app.App()
+    a.config_check_interval = args.config_check_interval
+    a.enable_profiling(args.profile_dir, args.profile_cycles)
 
+    if args.all_bots:
+        a.add_all_bots()
     for identifier in args.identifiers:
         a.add_bot(identifier)
 
-    if args.no_loop:
-        a.process_bots()
+    if args.workers and not args.no_loop:
+        s = supervisor.Supervisor(a.get_logger('supervisor'), list(a.get_bot_identifiers()), args.workers,
+                                  use_async=args.use_async, concurrency=args.concurrency,
+                                  metrics_port=args.metrics_port, metrics_host=args.metrics_host,
+                                  metrics_interval=args.metrics_interval, profile_dir=args.profile_dir,
+                                  profile_cycles=args.profile_cycles)
+        s.run()
+    elif args.no_loop:
+        try:
+            a.process_bots()
+        finally:
+            a.flush_bots()
+    elif args.use_async:
+        a.start_metrics(args.metrics_port, args.metrics_host, args.metrics_interval)
+        a.process_loop_async(args.concurrency)
     else:
+        a.start_metrics(args.metrics_port, args.metrics_host, args.metrics_interval)
         a.process_loop()
 
@@ -0,0 +1,223 @@
+import bisect
+import http.server
+import logging
+import threading
+import time
+
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    type_name = 'untyped'
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def get_key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def format_labels(self, key, extra=None):
+        pairs = list(zip(self.label_names, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.type_name}']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.extend(self.render_value(key, value))
+        return lines
+
+    def render_value(self, key, value):
+        return [f'{self.name}{self.format_labels(key)} {value}']
+
+    def get_total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, description, label_names=(), buckets=default_buckets):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # bucket counts, +Inf bucket, then sum and count
+                counts = [0] * (len(self.buckets) + 3)
+                self.values[key] = counts
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def time(self, **labels):
+        return HistogramTimer(self, labels)
+
+    def render_value(self, key, value):
+        lines = []
+        cumulative = 0
+        for bucket, count in zip(self.buckets, value):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{self.format_labels(key, ("le", bucket))} {cumulative}')
+        lines.append(f'{self.name}_bucket{self.format_labels(key, ("le", "+Inf"))} {value[-1]}')
+        lines.append(f'{self.name}_sum{self.format_labels(key)} {value[-2]}')
+        lines.append(f'{self.name}_count{self.format_labels(key)} {value[-1]}')
+        return lines
+
+    def get_total(self):
+        with self.lock:
+            return sum(counts[-1] for counts in self.values.values())
+
+    def get_sums(self):
+        # type: () -> dict[tuple, tuple[int, float]]
+        with self.lock:
+            return {key: (counts[-1], counts[-2]) for key, counts in self.values.items()}
+
+
+class HistogramTimer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, description, label_names=()):
+        return self.register(Counter(name, description, label_names))
+
+    def gauge(self, name, description, label_names=()):
+        return self.register(Gauge(name, description, label_names))
+
+    def histogram(self, name, description, label_names=(), buckets=default_buckets):
+        return self.register(Histogram(name, description, label_names, buckets))
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def get_totals(self):
+        with self.lock:
+            metrics = [m for m in self.metrics.values() if not isinstance(m, Gauge)]
+        return {metric.name: metric.get_total() for metric in metrics}
+
+
+registry = Registry()
+
+api_request_duration = registry.histogram('masto_api_request_duration_seconds', 'API request latency',
+                                          ('bot', 'method', 'endpoint'))
+api_responses = registry.counter('masto_api_responses_total', 'API responses by status code',
+                                 ('bot', 'endpoint', 'status'))
+rate_limit_remaining = registry.gauge('masto_rate_limit_remaining', 'API requests left in the rate limit window',
+                                      ('bot',))
+bot_task_duration = registry.histogram('masto_bot_task_duration_seconds', 'Bot task run duration', ('bot', 'task'))
+notifications_processed = registry.counter('masto_notifications_processed_total', 'Notifications processed', ('bot',))
+backlog_age = registry.gauge('masto_backlog_age_seconds',
+                             'Age of the oldest item left for the next cycle, 0 when caught up', ('bot', 'source'))
+statuses_processed = registry.counter('masto_statuses_processed_total', 'Home timeline statuses processed', ('bot',))
+boosts = registry.counter('masto_boosts_total', 'Boosts done or refused', ('bot', 'result'))
+reconcile_corrections = registry.counter('masto_reconcile_corrections_total',
+                                         'Follows and unfollows queued by follow reconciliation', ('bot', 'action'))
+action_queue_length = registry.gauge('masto_action_queue_length', 'Actions waiting in the action queue', ('bot',))
+status_cache_stats = registry.gauge('masto_status_cache', 'Status cache size, hits and misses', ('bot', 'stat'))
+connection_pool_stats = registry.gauge('masto_connection_pool', 'Connection pool idle, opened, reused and failed',
+                                       ('bot', 'stat'))
+store_duration = registry.histogram('masto_store_duration_seconds', 'User and status store operation duration',
+                                    ('bot', 'operation'), (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='127.0.0.1'):
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    return server
+
+
+def start_summary_logger(logger, interval):
+    # type: (logging.Logger, float) -> threading.Thread
+    def run():
+        previous = registry.get_totals()
+        while True:
+            time.sleep(interval)
+            totals = registry.get_totals()
+            parts = [f'{name[len("masto_"):]}={totals[name] - previous.get(name, 0):g}' for name in sorted(totals)]
+            logger.info(f"Last {interval:g}s: {' '.join(parts)}")
+            previous = totals
+
+    thread = threading.Thread(target=run, name='metrics-summary', daemon=True)
+    thread.start()
+    return thread
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,187 @@
+import cProfile
+import gc
+import io
+import logging
+import metrics
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+
+class Profiler:
+    # armed by signals: while idle, task runs only check the active flag
+    def __init__(self, logger, output_dir='.', cycles=10, memory_frames=10):
+        self.logger = logger  # type: logging.Logger
+        self.output_dir = output_dir
+        self.cycles = cycles
+        self.memory_frames = memory_frames
+
+        self.active = False
+        self.cpu_requested = False
+        self.memory_requested = False
+        self.runs_left = 0
+        self.start_time = 0
+        self.bot_stats = {}  # type: dict[str, pstats.Stats]
+        self.timings_start = None
+        self.memory_snapshot = None
+        self.lock = threading.Lock()
+        self.run_lock = threading.Lock()
+
+    def request_cpu(self, signum=None, frame=None):
+        # safe in a signal handler: the loop starts the profile on its next pass
+        self.cpu_requested = True
+
+    def request_memory(self, signum=None, frame=None):
+        self.memory_requested = True
+
+    def check_requests(self, task_count):
+        # task_count: scheduled tasks of all bots, a cycle is one run of each
+        if self.cpu_requested:
+            self.cpu_requested = False
+            self.start_cpu(self.cycles * max(task_count, 1))
+        if self.memory_requested:
+            self.memory_requested = False
+            self.toggle_memory()
+
+    def start_cpu(self, runs):
+        with self.lock:
+            if self.active:
+                self.logger.warning("CPU profile already running")
+                return
+            self.runs_left = runs
+            self.bot_stats = {}
+            self.timings_start = get_timings()
+            self.start_time = time.time()
+            self.active = True
+        self.logger.info(f"CPU profile started for {self.cycles} cycles ({runs} task runs)")
+
+    def run(self, identifier, func, *args):
+        # one profiled task at a time: since python 3.12 a single profiler can be active, so tasks of other
+        # worker threads of the async loop overlapping it run without one
+        if not self.run_lock.acquire(blocking=False):
+            return func(*args)
+        try:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as e:
+                # another profiling tool is active, a debugger or coverage
+                self.logger.debug(f"Task run not profiled - {e}")
+                return func(*args)
+            try:
+                return func(*args)
+            finally:
+                profile.disable()
+                self.add_stats(identifier, profile)
+        finally:
+            self.run_lock.release()
+
+    def add_stats(self, identifier, profile):
+        with self.lock:
+            if not self.active:
+                return  # the profile ended while the task ran
+            stats = self.bot_stats.get(identifier)
+            if stats is None:
+                self.bot_stats[identifier] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            self.runs_left -= 1
+            done = self.runs_left <= 0
+            if done:
+                self.active = False
+                bot_stats = self.bot_stats
+                self.bot_stats = {}
+        if done:
+            self.write_cpu(bot_stats)
+
+    def write_cpu(self, bot_stats):
+        duration = time.time() - self.start_time
+        timings = get_timings()
+        path = self.get_output_path('profile', 'txt')
+
+        out = io.StringIO()
+        out.write(f"CPU profile, {self.cycles} cycles, {duration:.1f}s wall time, pid {os.getpid()}\n")
+
+        out.write("\nTask time per bot (s, runs)\n")
+        for (bot, task), (count, total) in diff_timings(self.timings_start['tasks'], timings['tasks']):
+            out.write(f"  {bot:<24} {task:<24} {total:>10.3f} {count:>6}\n")
+
+        out.write("\nAPI time per endpoint (s, requests, mean ms)\n")
+        for (bot, method, endpoint), (count, total) in diff_timings(self.timings_start['api'], timings['api']):
+            out.write(f"  {bot:<24} {method:<6} {endpoint:<48} {total:>10.3f} {count:>6} "
+                      f"{total / count * 1000:>8.1f}\n")
+
+        combined = pstats.Stats()
+        for identifier, stats in sorted(bot_stats.items()):
+            out.write(f"\nBot {identifier}, by cumulative time\n")
+            stats.stream = out
+            stats.sort_stats('cumulative').print_stats(25)
+            combined.add(stats)
+
+        if bot_stats:
+            out.write("\nAll bots, by own time\n")
+            combined.stream = out
+            combined.sort_stats('tottime').print_stats(40)
+            # raw stats for snakeviz, gprof2dot or pstats
+            combined.dump_stats(path[:-len('.txt')] + '.prof')
+
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(out.getvalue())
+        self.logger.info(f"CPU profile written to {path}")
+
+    def toggle_memory(self):
+        # first request starts tracing, the next one writes what was allocated since and is still alive
+        if self.memory_snapshot is None:
+            tracemalloc.start(self.memory_frames)
+            self.memory_snapshot = tracemalloc.take_snapshot()
+            self.logger.info("Memory tracing started, request again for the snapshot diff")
+            return
+
+        gc.collect()  # only what is really retained
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        # leaves out the profiler's own allocations
+        filters = (tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, pstats.__file__),
+                   tracemalloc.Filter(False, cProfile.__file__),
+                   tracemalloc.Filter(False, '<frozen importlib._bootstrap>'))
+        snapshot = snapshot.filter_traces(filters)
+        previous = self.memory_snapshot.filter_traces(filters)
+        self.memory_snapshot = None
+
+        path = self.get_output_path('memory', 'txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            total = sum(stat.size for stat in snapshot.statistics('filename'))
+            f.write(f"Memory snapshot diff, {total / 1024:.1f} KiB traced, pid {os.getpid()}\n")
+
+            f.write("\nBy line\n")
+            for stat in snapshot.compare_to(previous, 'lineno')[:50]:
+                f.write(f"  {stat}\n")
+
+            f.write("\nLargest allocation sites\n")
+            for stat in snapshot.statistics('traceback')[:10]:
+                f.write(f"\n  {stat.count} blocks, {stat.size / 1024:.1f} KiB\n")
+                for line in stat.traceback.format():
+                    f.write(f"  {line}\n")
+        self.logger.info(f"Memory snapshot diff written to {path}")
+
+    def get_output_path(self, kind, extension):
+        timestamp = time.strftime('%Y%m%d-%H%M%S')
+        return os.path.join(self.output_dir, f'{kind}.{os.getpid()}.{timestamp}.{extension}')
+
+
+def get_timings():
+    return {'tasks': metrics.bot_task_duration.get_sums(), 'api': metrics.api_request_duration.get_sums()}
+
+
+def diff_timings(start, end):
+    # [(labels, (count, seconds))] accumulated between two get_sums, slowest first
+    rows = []
+    for key, (count, total) in end.items():
+        start_count, start_total = start.get(key, (0, 0))
+        if count > start_count:
+            rows.append((key, (count - start_count, total - start_total)))
+    rows.sort(key=lambda row: row[1][1], reverse=True)
+    return rows
@@ -0,0 +1,106 @@
+import threading
+import time
+
+PRIORITY_HIGH = 0  # notifications and user commands
+PRIORITY_LOW = 1  # home timeline boosts
+
+schedulers = {}
+schedulers_lock = threading.Lock()
+
+
+class RateLimitException(Exception):
+    pass
+
+
+class RateLimitScheduler:
+    def __init__(self, reserve=50, burst=100, max_wait=5):
+        self.reserve = reserve
+        self.burst = burst
+        self.max_wait = max_wait
+
+        self.limit = None
+        self.remaining = None
+        self.reset_time = None
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def configure(self, reserve, burst, max_wait):
+        # type: (int, int, float) -> list[str]
+        values = {'reserve': reserve, 'burst': burst, 'max_wait': max_wait}
+        with self.lock:
+            changes = [f'{name} {getattr(self, name)} -> {value}' for name, value in values.items()
+                       if getattr(self, name) != value]
+            for name, value in values.items():
+                setattr(self, name, value)
+        return changes
+
+    def update(self, limit, remaining, reset_date):
+        with self.lock:
+            if limit is not None:
+                self.limit = limit
+            if remaining is not None:
+                self.remaining = remaining
+            if reset_date is not None:
+                self.reset_time = reset_date.timestamp()
+
+    def get_available(self, priority):
+        # requests left in the window for this priority, low priority leaves a reserve for commands
+        reserve = 0 if priority == PRIORITY_HIGH else self.reserve
+        return self.remaining - reserve
+
+    def get_delay(self, priority, now=None):
+        if now is None:
+            now = time.time()
+
+        with self.lock:
+            if self.remaining is None or self.reset_time is None or now >= self.reset_time:
+                return 0
+
+            available = self.get_available(priority)
+            if available <= 0:
+                return self.reset_time - now
+            if available > self.burst:
+                return 0
+            return max(self.next_time - now, 0)
+
+    def can_proceed(self, priority):
+        return self.get_delay(priority) <= self.max_wait
+
+    def acquire(self, priority):
+        now = time.time()
+        with self.lock:
+            if self.remaining is None or self.reset_time is None or now >= self.reset_time:
+                return True
+
+            available = self.get_available(priority)
+            if available <= 0:
+                return False
+
+            start = now
+            if available <= self.burst:
+                # close to the limit: spread what is left evenly over the rest of the window
+                start = max(self.next_time, now)
+                if start - now > self.max_wait:
+                    return False
+                self.next_time = start + (self.reset_time - start) / available
+
+            # consume the token now, headers of the response will correct the count
+            self.remaining -= 1
+
+        if start > now:
+            time.sleep(start - now)
+        return True
+
+    def get_reset_time(self):
+        return self.reset_time
+
+
+def get_scheduler(key, reserve=50, burst=100, max_wait=5):
+    # shared by all api clients using the same (instance, token), created with the values of the first one,
+    # configure applies those of the others
+    with schedulers_lock:
+        scheduler = schedulers.get(key)
+        if scheduler is None:
+            scheduler = RateLimitScheduler(reserve, burst, max_wait)
+            schedulers[key] = scheduler
+        return scheduler
@@ -0,0 +1,156 @@
+import collections
+import json
+import threading
+import time
+import urllib.parse
+
+recorders = {}
+recorders_lock = threading.Lock()
+
+
+class Recorder:
+    # appends api traffic as json lines, the body as text so recordings stay greppable
+    def __init__(self, path):
+        self.path = path
+
+        self.file = open(path, 'a', encoding='utf-8')
+        self.lock = threading.Lock()
+
+    def record(self, name, method, path, query, response, body, duration):
+        line = json.dumps({
+            'time': time.time(),
+            'bot': name,
+            'method': method,
+            'path': path,
+            'query': [list(item) for item in query.items()] if isinstance(query, dict) else query,
+            'status': response.status,
+            'reason': response.reason,
+            # the body is stored decompressed
+            'headers': [[k, v] for k, v in response.getheaders() if k.lower() != 'content-encoding'],
+            'body': str(body, 'utf-8', 'replace'),
+            'duration': duration,
+        }, default=str)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class ReplayResponse:
+    def __init__(self, record):
+        self.status = record['status']
+        self.reason = record.get('reason', '')
+        self.headers = [(k, v) for k, v in record.get('headers', [])]
+        self.body = record.get('body', '').encode('utf-8')
+        self.will_close = False
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        for k, v in self.headers:
+            if k.lower() == name:
+                return v
+        return default
+
+    def getheaders(self):
+        return list(self.headers)
+
+    def read(self):
+        return self.body
+
+
+class ReplayConnection:
+    def __init__(self, pool):
+        self.pool = pool  # type: ReplayPool
+        self.response = None
+
+    def request(self, method, url, body=None, headers=None):
+        self.response = self.pool.get_response(method, url)
+
+    def getresponse(self):
+        return self.response
+
+    def close(self):
+        pass
+
+
+class ReplayPool:
+    # stands in for the connection pool, answers requests from a recording instead of the network
+    def __init__(self, path, speed=None, name=None):
+        self.path = path
+        self.speed = speed
+        self.name = name
+
+        self.records = collections.defaultdict(collections.deque)  # (method, path) -> records in recorded order
+        self.last_records = {}
+        self.lock = threading.Lock()
+        self.replayed = 0
+        self.missed = 0
+
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if name is not None and record.get('bot', name) != name:
+                        continue
+                    self.records[(record['method'], record['path'])].append(record)
+
+    def get_response(self, method, url):
+        path = urllib.parse.urlsplit(url).path
+        key = (method, path)
+        with self.lock:
+            queue = self.records.get(key)
+            if queue:
+                record = queue.popleft()
+                self.last_records[key] = record
+                self.replayed += 1
+            else:
+                record = get_exhausted_record(self.last_records.get(key))
+                self.missed += 1
+
+        if self.speed and record.get('duration'):
+            time.sleep(record['duration'] / self.speed)
+
+        return ReplayResponse(record)
+
+    def get(self):
+        return ReplayConnection(self), False
+
+    def put(self, conn):
+        pass
+
+    def discard(self, conn):
+        pass
+
+    def close(self):
+        pass
+
+    def is_exhausted(self):
+        with self.lock:
+            return not any(self.records.values())
+
+    def get_stats(self):
+        with self.lock:
+            return {'replayed': self.replayed, 'missed': self.missed,
+                    'remaining': sum(len(queue) for queue in self.records.values())}
+
+
+def get_exhausted_record(last_record):
+    # once a timeline has been replayed it stays empty, anything never recorded is missing
+    if last_record is not None and last_record.get('body', '').startswith('['):
+        headers = [[k, v] for k, v in last_record.get('headers', []) if k.lower() != 'link']
+        return {'status': 200, 'reason': 'OK', 'headers': headers, 'body': '[]'}
+    return {'status': 404, 'reason': 'Not Found', 'headers': [['Content-Type', 'application/json; charset=utf-8']],
+            'body': '{"error":"Record not found"}'}
+
+
+def get_recorder(path):
+    # bots recording to the same file share the writer
+    with recorders_lock:
+        recorder = recorders.get(path)
+        if recorder is None:
+            recorder = Recorder(path)
+            recorders[path] = recorder
+        return recorder
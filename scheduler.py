@@ -0,0 +1,78 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+class TaskScheduler:
+    def __init__(self, jitter=0.1, wakeup=None):
+        self.jitter = jitter
+
+        self.heap = []  # (due time, sequence, key, period)
+        self.sequence = itertools.count()
+        self.wakeup = wakeup or threading.Event()
+
+    def add(self, key, period, due=None):
+        if due is None:
+            # spread first runs over a period so bots started together don't fire on the same second
+            due = time.time() + random.uniform(0, period)
+        heapq.heappush(self.heap, (due, next(self.sequence), key, period))
+
+    def set_period(self, key, period):
+        # keeps the last run time: the next run moves by the period difference
+        for i, (due, sequence, entry_key, entry_period) in enumerate(self.heap):
+            if entry_key == key:
+                self.heap[i] = (due + period - entry_period, sequence, key, period)
+                heapq.heapify(self.heap)
+                return True
+        return False
+
+    def remove(self, predicate):
+        self.heap = [entry for entry in self.heap if not predicate(entry[2])]
+        heapq.heapify(self.heap)
+
+    def pop_due(self, now=None):
+        # type: (float | None) -> list[tuple[object, float, float]]
+        if now is None:
+            now = time.time()
+
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            due_time, sequence, key, period = heapq.heappop(self.heap)
+            due.append((key, period, due_time))
+        return due
+
+    def reschedule(self, key, period, due_time, now=None, delay=None):
+        if now is None:
+            now = time.time()
+
+        if delay is not None:
+            next_time = now + delay
+        else:
+            next_time = due_time + period
+            if next_time <= now:
+                # behind schedule: skip the missed runs instead of running them back to back
+                next_time = now + period
+            next_time += random.uniform(0, period * self.jitter)
+
+        self.add(key, period, next_time)
+
+    def get_next_due(self):
+        if not self.heap:
+            return None
+        return self.heap[0][0]
+
+    def wait(self, max_wait=None):
+        timeout = None
+        next_due = self.get_next_due()
+        if next_due is not None:
+            timeout = max(next_due - time.time(), 0)
+        if max_wait is not None:
+            timeout = max_wait if timeout is None else min(timeout, max_wait)
+
+        self.wakeup.wait(timeout)
+        self.wakeup.clear()
+
+    def wake(self):
+        self.wakeup.set()
@@ -0,0 +1,128 @@
+import configparser
+import config
+import re
+
+re_camel_case = re.compile(r'(?<!^)(?=[A-Z])')
+
+
+class Setting:
+    def __init__(self, key, kind='str', default=None, required=False, minimum=None, choices=None, evaluated=False,
+                 reset=None):
+        self.key = key
+        self.kind = kind  # str, int, float, bool or list (comma separated)
+        self.default = default
+        self.required = required
+        self.minimum = minimum
+        self.choices = choices
+        self.evaluated = evaluated  # env:NAME values are read from the environment
+        self.reset = reset  # bot component rebuilt when the value changes, applied without it otherwise
+
+        self.name = re_camel_case.sub('_', key).lower()
+
+    def read(self, cfg, section):
+        # type: (config.Config, str) -> object
+        parser = cfg.get_config()
+        if not parser.has_option(section, self.key):
+            if self.required:
+                raise Exception(f"Missing setting {section}.{self.key}")
+            return self.default
+
+        try:
+            if self.kind == 'int':
+                value = parser.getint(section, self.key)
+            elif self.kind == 'float':
+                value = parser.getfloat(section, self.key)
+            elif self.kind == 'bool':
+                value = parser.getboolean(section, self.key)
+            elif self.kind == 'list':
+                value = parse_list(parser.get(section, self.key))
+            elif self.evaluated:
+                value = cfg.get_evaluated(section, self.key)
+            else:
+                value = parser.get(section, self.key)
+        except (ValueError, configparser.Error) as e:
+            raise Exception(f"Invalid setting {section}.{self.key} - {e}") from e
+
+        if self.minimum is not None and value < self.minimum:
+            raise Exception(f"Invalid setting {section}.{self.key}: {value} < {self.minimum}")
+        if self.choices is not None and value not in self.choices:
+            raise Exception(f"Invalid setting {section}.{self.key}: '{value}' not in {', '.join(self.choices)}")
+        return value
+
+
+class BotSettings:
+    # read once per config load, bots swap the whole object on reload
+    def __init__(self, identifier, definitions, values):
+        self.identifier = identifier
+        self.definitions = definitions  # type: list[Setting]
+        self.values = values
+
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def get_changes(self, other):
+        # type: (BotSettings) -> list[Setting]
+        return [d for d in self.definitions if self.values.get(d.name) != other.values.get(d.name)]
+
+
+bot_settings = [
+    Setting('Type', required=True, reset='bot'),
+    Setting('InstanceBaseUrl', required=True, reset='api'),
+    Setting('UserApiKey', required=True, evaluated=True, reset='api'),
+    Setting('PersistentConnections', 'bool', True, reset='api'),
+    Setting('RateLimitReserve', 'int', 50, minimum=0, reset='api'),
+    Setting('RateLimitBurst', 'int', 100, minimum=0, reset='api'),
+    Setting('RateLimitMaxWait', 'float', 5, minimum=0, reset='api'),
+    Setting('ConnectionPoolSize', 'int', 4, minimum=1, reset='api'),
+    Setting('ConnectionIdleTimeout', 'float', 60, minimum=0, reset='api'),
+    Setting('ConnectionTimeout', 'float', 30, minimum=1, reset='api'),
+    Setting('ReplayApiTraffic', reset='api'),
+    Setting('ReplaySpeed', 'float', 0, minimum=0, reset='api'),
+    Setting('RecordApiTraffic', reset='api'),
+    Setting('ProjectStatuses', 'bool', False, reset='api'),
+    Setting('Streaming', 'bool', False, reset='stream'),
+    Setting('StreamingBaseUrl', reset='stream'),
+    Setting('UserStore', 'str', 'dbm', choices=('dbm', 'sqlite'), reset='user_store'),
+    Setting('StatusCacheSize', 'int', 1000, minimum=0, reset='status_cache'),
+    Setting('StatusCacheTtl', 'int', 300, minimum=0, reset='status_cache'),
+    Setting('StatusCacheNegativeTtl', 'int', 30, minimum=0, reset='status_cache'),
+    Setting('ActionBatchSize', 'int', 50, minimum=1),
+    Setting('ActionMaxAttempts', 'int', 8, minimum=1),
+    Setting('ActionRetryDelay', 'float', 5, minimum=0),
+    Setting('ActionCheckFrequency', 'float', 5, minimum=0.1),
+    Setting('FlushInterval', 'float', 0, minimum=0),
+    Setting('TimelineCheckFrequency', 'float', required=True, minimum=0.1),
+    Setting('NotificationCheckFrequency', 'float', required=True, minimum=0.1),
+    Setting('CycleTimeBudget', 'float', 20, minimum=0),
+    Setting('CycleRequestBudget', 'int', 50, minimum=0),
+    Setting('HomeMaxPagesPerCycle', 'int', 10, minimum=1),
+    Setting('HomeBackfillMaxAge', 'float', 3600, minimum=0),
+    Setting('HomeBackfillMaxStatuses', 'int', 1000, minimum=0),
+    Setting('NotificationFetchMode', 'str', 'all', choices=('all', 'mentions')),
+    Setting('NotificationDismiss', 'str', 'each', choices=('each', 'none')),
+    Setting('PrefetchConcurrency', 'int', 4, minimum=1),
+    Setting('BoostLimit', 'int', required=True, minimum=0),
+    Setting('UserLimit', 'int', required=True, minimum=0),
+    Setting('CommandIgnoreCase', 'bool', False, reset='commands'),
+    Setting('Reconcile', 'bool', False),
+    Setting('ReconcileInterval', 'float', 86400, minimum=0),
+    Setting('ReconcileCheckFrequency', 'float', 60, minimum=1),
+    Setting('ReconcilePagesPerCycle', 'int', 2, minimum=1),
+    Setting('ReconcileUnfollowUnknown', 'bool', False),
+]
+
+
+def load_bot_settings(cfg, identifier, definitions=None):
+    # type: (config.Config, str, list[Setting] | None) -> BotSettings
+    if definitions is None:
+        definitions = bot_settings
+    if not cfg.get_config().has_section(identifier):
+        raise Exception(f"Missing config section [{identifier}]")
+
+    values = {d.name: d.read(cfg, identifier) for d in definitions}
+    return BotSettings(identifier, definitions, values)
+
+
+def parse_list(value):
+    # "boost, partager, teilen" -> ['boost', 'partager', 'teilen']
+    return [v.strip() for v in value.split(',') if v.strip()]
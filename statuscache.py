@@ -0,0 +1,86 @@
+import collections
+import threading
+import time
+
+caches = {}
+caches_lock = threading.Lock()
+
+
+class StatusCache:
+    def __init__(self, max_size=1000, ttl=300, negative_ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_size, ttl, negative_ttl):
+        # type: (int, int, int) -> list[str]
+        values = {'max_size': max_size, 'ttl': ttl, 'negative_ttl': negative_ttl}
+        with self.lock:
+            changes = [f'{name} {getattr(self, name)} -> {value}' for name, value in values.items()
+                       if getattr(self, name) != value]
+            for name, value in values.items():
+                setattr(self, name, value)
+            while len(self.entries) > max_size:
+                self.entries.popitem(last=False)
+        return changes
+
+    def get(self, status_id):
+        # type: (str) -> tuple[bool, dict | None]
+        key = str(status_id)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires, status = entry
+                if time.monotonic() < expires:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, status
+                del self.entries[key]
+
+            self.misses += 1
+            return False, None
+
+    def has(self, status_id):
+        with self.lock:
+            entry = self.entries.get(str(status_id))
+            return entry is not None and time.monotonic() < entry[0]
+
+    def put(self, status_id, status):
+        self.put_entry(str(status_id), status, self.ttl)
+
+    def put_missing(self, status_id):
+        # None = status not found or not visible
+        self.put_entry(str(status_id), None, self.negative_ttl)
+
+    def put_entry(self, key, status, ttl):
+        if ttl <= 0 or self.max_size <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, status)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, status_id):
+        with self.lock:
+            self.entries.pop(str(status_id), None)
+
+    def get_stats(self):
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def get_status_cache(key, max_size=1000, ttl=300, negative_ttl=30):
+    # shared by all bots of the same instance, created with the values of the first one, configure applies those of
+    # the others
+    with caches_lock:
+        cache = caches.get(key)
+        if cache is None:
+            cache = StatusCache(max_size, ttl, negative_ttl)
+            caches[key] = cache
+        return cache
@@ -0,0 +1,108 @@
+import jsondecode
+import logging
+import queue
+import threading
+import time
+
+EVENT_CONNECTED = 'connected'
+EVENT_DISCONNECTED = 'disconnected'
+
+
+class UserStream:
+    def __init__(self, logger, api, base_url=None, timeout=90, min_backoff=1, max_backoff=300):
+        self.logger = logger  # type: logging.Logger
+        self.api = api
+        self.base_url = base_url
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.events = queue.Queue()
+        self.connected = False
+        self.stop_flag = False
+        self.thread = None
+        self.conn = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name=f'{self.logger.name}.stream', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_flag = True
+        if self.conn is not None:
+            self.conn.close()
+
+    def is_connected(self):
+        return self.connected
+
+    def run(self):
+        backoff = self.min_backoff
+        while not self.stop_flag:
+            try:
+                self.conn, r = self.api.open_user_stream(self.base_url, self.timeout)
+                self.logger.info("Stream connected")
+                self.connected = True
+                self.events.put((EVENT_CONNECTED, None))
+                backoff = self.min_backoff
+
+                for event, data in read_sse_events(r):
+                    self.events.put((event, data))
+
+                self.logger.warning("Stream closed by server")
+            except Exception as e:
+                if self.stop_flag:
+                    break
+                self.logger.warning(f"Stream error - {e}")
+            finally:
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+                if self.connected:
+                    self.connected = False
+                    self.events.put((EVENT_DISCONNECTED, None))
+
+            if not self.stop_flag:
+                self.logger.info(f"Stream reconnecting in {backoff}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def get_events(self):
+        while True:
+            try:
+                yield self.events.get_nowait()
+            except queue.Empty:
+                return
+
+
+def read_sse_events(response):
+    event = None
+    data_lines = []
+    while True:
+        line = response.readline()
+        if not line:
+            return
+
+        line = str(line, 'utf-8').rstrip('\r\n')
+        if line == '':
+            if data_lines:
+                yield event or 'message', parse_event_data('\n'.join(data_lines))
+            event = None
+            data_lines = []
+        elif line.startswith(':'):
+            pass  # heartbeat
+        else:
+            field, _, value = line.partition(':')
+            if value.startswith(' '):
+                value = value[1:]
+            if field == 'event':
+                event = value
+            elif field == 'data':
+                data_lines.append(value)
+
+
+def parse_event_data(value):
+    try:
+        return jsondecode.loads(value)
+    except jsondecode.DecodeError:
+        return value
@@ -0,0 +1,176 @@
+import app
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+
+class Worker:
+    def __init__(self, index, identifiers):
+        self.index = index
+        self.identifiers = identifiers
+
+        self.process = None  # type: multiprocessing.Process | None
+        self.start_time = 0
+        self.last_heartbeat = 0
+        self.terminate_time = 0
+        self.restart_time = 0
+        self.backoff = 0
+
+
+class Supervisor:
+    def __init__(self, logger, identifiers, worker_count, config_path='config.ini', logging_config_path='logging.conf',
+                 use_async=False, concurrency=None, heartbeat_timeout=300, kill_timeout=30, min_backoff=1,
+                 max_backoff=300,
+                 metrics_port=None, metrics_host='127.0.0.1', metrics_interval=None, profile_dir='.',
+                 profile_cycles=10):
+        self.logger = logger  # type: logging.Logger
+        self.config_path = config_path
+        self.logging_config_path = logging_config_path
+        self.use_async = use_async
+        self.concurrency = concurrency
+        self.heartbeat_timeout = heartbeat_timeout
+        self.kill_timeout = kill_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.metrics_interval = metrics_interval
+        self.profile_dir = profile_dir
+        self.profile_cycles = profile_cycles
+
+        # a bot always belongs to a single worker, its db files have a single writer
+        worker_count = max(min(worker_count, len(identifiers)), 1)
+        self.workers = [Worker(i, identifiers[i::worker_count]) for i in range(worker_count)]
+        self.heartbeats = multiprocessing.Queue()
+        self.stop_flag = False
+
+    def stop_handler(self, signum, frame):
+        self.stop_flag = True
+
+    def forward_handler(self, signum, frame):
+        # config reloads and profiling requests go to every worker, each reloads its own bots or writes its own pid
+        # stamped reports
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                os.kill(worker.process.pid, signum)
+
+    def get_worker_metrics_port(self, worker):
+        # one scrape target per worker process: base port + worker index
+        if self.metrics_port is None:
+            return None
+        return self.metrics_port + worker.index
+
+    def start_worker(self, worker):
+        # type: (Worker) -> None
+        worker.process = multiprocessing.Process(target=run_worker,
+                                                 name=f'worker{worker.index}',
+                                                 args=(worker.index, worker.identifiers, self.heartbeats,
+                                                       self.config_path, self.logging_config_path,
+                                                       self.use_async, self.concurrency,
+                                                       self.get_worker_metrics_port(worker), self.metrics_host,
+                                                       self.metrics_interval, self.profile_dir, self.profile_cycles))
+        worker.process.start()
+        worker.start_time = time.time()
+        worker.last_heartbeat = worker.start_time
+        worker.terminate_time = 0
+        self.logger.info(f"Started worker {worker.index} (pid {worker.process.pid}): {', '.join(worker.identifiers)}")
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop_handler)
+        signal.signal(signal.SIGTERM, self.stop_handler)
+        signal.signal(signal.SIGHUP, self.forward_handler)
+        signal.signal(signal.SIGUSR1, self.forward_handler)
+        signal.signal(signal.SIGUSR2, self.forward_handler)
+
+        self.logger.info(f"Starting {len(self.workers)} workers...")
+
+        for worker in self.workers:
+            self.start_worker(worker)
+
+        while not self.stop_flag:
+            self.read_heartbeats()
+            self.check_workers()
+
+        self.logger.info("Exit requested, stopping workers")
+        self.stop_workers()
+
+    def read_heartbeats(self):
+        try:
+            index, pid, timestamp = self.heartbeats.get(timeout=1)
+        except queue.Empty:
+            return
+
+        while True:
+            worker = self.workers[index]
+            if worker.process is not None and worker.process.pid == pid:
+                worker.last_heartbeat = timestamp
+
+            try:
+                index, pid, timestamp = self.heartbeats.get_nowait()
+            except queue.Empty:
+                return
+
+    def check_workers(self):
+        if self.stop_flag:
+            return  # workers exiting on the same signal are not restarted
+
+        now = time.time()
+        for worker in self.workers:
+            if worker.process is None:
+                if now >= worker.restart_time:
+                    self.start_worker(worker)
+                continue
+
+            if not worker.process.is_alive():
+                # a worker that ran for a while before crashing restarts quickly again
+                if now - worker.start_time > self.max_backoff:
+                    worker.backoff = 0
+                worker.backoff = min(max(worker.backoff * 2, self.min_backoff), self.max_backoff)
+                worker.restart_time = now + worker.backoff
+                self.logger.error(f"Worker {worker.index} exited ({worker.process.exitcode}), "
+                                  f"restarting in {worker.backoff}s")
+                worker.process = None
+            elif worker.terminate_time:
+                # a worker hung in a blocking call may never run its SIGTERM handler
+                if now - worker.terminate_time > self.kill_timeout:
+                    self.logger.error(f"Worker {worker.index} did not stop {self.kill_timeout}s after terminate, "
+                                      f"killing")
+                    worker.process.kill()  # reaped and restarted by the exit branch once it is gone
+            elif now - worker.last_heartbeat > self.heartbeat_timeout:
+                self.logger.error(f"Worker {worker.index} sent no heartbeat for {int(now - worker.last_heartbeat)}s, "
+                                  f"terminating")
+                worker.process.terminate()
+                worker.terminate_time = now
+
+    def stop_workers(self, timeout=60):
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.process.terminate()  # SIGTERM, workers flush and exit after their current cycle
+
+        deadline = time.time() + timeout
+        for worker in self.workers:
+            if worker.process is not None:
+                worker.process.join(max(deadline - time.time(), 0))
+                if worker.process.is_alive():
+                    self.logger.error(f"Worker {worker.index} did not stop in time, killing")
+                    worker.process.kill()
+                    worker.process.join()
+
+
+def run_worker(index, identifiers, heartbeats, config_path, logging_config_path, use_async, concurrency,
+               metrics_port=None, metrics_host='127.0.0.1', metrics_interval=None, profile_dir='.', profile_cycles=10):
+    a = app.App(config_path, logging_config_path)
+    a.enable_profiling(profile_dir, profile_cycles)
+    a.heartbeat_callback = lambda: heartbeats.put((index, os.getpid(), time.time()))
+    a.start_metrics(metrics_port, metrics_host, metrics_interval)
+
+    for identifier in identifiers:
+        a.add_bot(identifier)
+
+    if use_async:
+        a.process_loop_async(concurrency)
+    else:
+        a.process_loop()
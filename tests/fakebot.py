@@ -0,0 +1,84 @@
+# coding=utf-8
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+import botabstract  # noqa: E402
+import config  # noqa: E402
+import fakemastodon  # noqa: E402
+
+logging.getLogger().setLevel(logging.CRITICAL)
+
+
+class RecordingBot(botabstract.BotAbstract):
+    # records what reaches the bot instead of acting on it
+    def __init__(self, identifier, cfg):
+        super().__init__(identifier, cfg)
+        self.notifications = []
+        self.statuses = []
+
+    def process_notification(self, data):
+        self.notifications.append(data['id'])
+
+    def process_home_status(self, status):
+        super().process_home_status(status)
+        self.statuses.append(status['id'])
+
+
+class FakeServerTestCase(unittest.TestCase):
+    # bots in a temporary directory, talking to a fake Mastodon server
+    bot_config = ''
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+
+        self.fake = fakemastodon.FakeMastodon()
+        self.fake.start()
+        self.bots = []
+
+    def tearDown(self):
+        for bot in self.bots:
+            bot.close()
+        self.fake.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def create_bot(self, extra=''):
+        with open('config.ini', 'w') as f:
+            f.write(f'''[test]
+InstanceBaseUrl = {self.fake.get_base_url()}
+UserApiKey = test
+Type = AutoShareTags
+UserLimit = 10
+BoostLimit = 10
+TimelineCheckFrequency = 1
+NotificationCheckFrequency = 1
+{self.bot_config}
+{extra}
+''')
+        bot = RecordingBot('test', config.Config('config.ini'))
+        self.bots.append(bot)
+        return bot
+
+    def add_status(self, i=0):
+        return self.fake.add_home_status('test', fakemastodon.get_user_uri(i), fakemastodon.get_user_account_id(i),
+                                         ['cats'])
+
+    def add_statuses(self, count):
+        return [self.add_status(i)['id'] for i in range(count)]
+
+    def add_mention(self, i=0):
+        return self.fake.add_mention('test', fakemastodon.get_user_uri(i), fakemastodon.get_user_account_id(i),
+                                     'hello')
+
+    def add_mentions(self, count):
+        return [self.add_mention(i)['id'] for i in range(count)]
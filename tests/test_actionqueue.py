@@ -0,0 +1,62 @@
+# coding=utf-8
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import actionqueue  # noqa: E402
+
+logger = logging.getLogger('test')
+
+
+class ActionQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'actions.sqlite3')
+        self.queue = self.open_queue()
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.directory)
+
+    def open_queue(self):
+        queue = actionqueue.ActionQueue(logger, self.path)
+        queue.open()
+        return queue
+
+    def test_count_user(self):
+        self.assertTrue(self.queue.push('reblog', '1', 'u'))
+        self.assertTrue(self.queue.push('reblog', '2', 'u'))
+        self.assertFalse(self.queue.push('reblog', '2', 'u'))
+        self.queue.push('reblog', '3', 'v')
+        self.assertEqual(self.queue.count_user('reblog', 'u'), 2)
+
+        self.queue.remove('reblog', '1')
+        self.queue.remove('reblog', '1')
+        self.assertEqual(self.queue.count_user('reblog', 'u'), 1)
+        self.assertEqual(self.queue.count_user('reblog', 'v'), 1)
+
+    def test_opposite_cancels_count(self):
+        self.queue.push('reblog', '1', 'u')
+        self.queue.push('unreblog', '1', 'u')
+        self.assertEqual(self.queue.count_user('reblog', 'u'), 0)
+        self.assertEqual(self.queue.count_user('unreblog', 'u'), 1)
+
+    def test_count_user_after_reopen(self):
+        self.queue.push('reblog', '1', 'u')
+        self.queue.push('reblog', '2', 'u')
+        self.queue.push('follow', '3')
+        self.queue.close()
+
+        self.queue = self.open_queue()
+        self.assertEqual(self.queue.count_user('reblog', 'u'), 2)
+        self.assertEqual(self.queue.count(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
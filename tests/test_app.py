@@ -0,0 +1,156 @@
+# coding=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app  # noqa: E402
+import fakebot  # noqa: E402
+import scheduler  # noqa: E402
+
+logging_config = '''[loggers]
+keys=root
+
+[handlers]
+keys=null
+
+[formatters]
+keys=
+
+[logger_root]
+level=CRITICAL
+handlers=null
+
+[handler_null]
+class=NullHandler
+args=()
+'''
+
+
+class ReloadTest(fakebot.FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+        app.bot_type_mapping['Recording'] = fakebot.RecordingBot
+        with open('logging.conf', 'w') as f:
+            f.write(logging_config)
+
+    def tearDown(self):
+        del app.bot_type_mapping['Recording']
+        for bot in self.app.bots.values():
+            if bot:
+                bot.close()
+        super().tearDown()
+
+    def write_config(self, types):
+        with open('config.ini', 'w') as f:
+            for identifier, bot_type in types.items():
+                f.write(f'''[{identifier}]
+InstanceBaseUrl = {self.fake.get_base_url()}
+UserApiKey = {identifier}
+Type = {bot_type}
+UserLimit = 10
+BoostLimit = 10
+TimelineCheckFrequency = 60
+NotificationCheckFrequency = 60
+''')
+        # a new mtime even within the same clock tick
+        stat = os.stat('config.ini')
+        os.utime('config.ini', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000))
+
+    def start_app(self):
+        self.write_config({'b1': 'AutoShareTags', 'b2': 'AutoShareTags'})
+        self.app = app.App('config.ini', 'logging.conf')
+        self.app.add_all_bots()
+        self.app.task_scheduler = scheduler.TaskScheduler()
+        for identifier in list(self.app.bots):
+            self.app.schedule_bot(identifier)
+        self.app.task_scheduler.add((None, self.app.reload_bots), 60)
+
+        # everything due, the config check first
+        heap = self.app.task_scheduler.heap
+        self.app.task_scheduler.heap = [(1 if key[0] else 0, sequence, key, period)
+                                        for due, sequence, key, period in heap]
+
+    def get_scheduled_identifiers(self):
+        return {key[0] for due, sequence, key, period in self.app.task_scheduler.heap}
+
+    def test_removed_bot_in_due_batch(self):
+        self.start_app()
+        self.write_config({'b1': 'AutoShareTags'})
+
+        self.app.process_due_tasks()
+        self.assertEqual(list(self.app.bots), ['b1'])
+        self.assertEqual(self.get_scheduled_identifiers(), {None, 'b1'})
+
+    def test_restarted_bot_in_due_batch(self):
+        self.start_app()
+        old_bot = self.app.get_bot('b2')
+        self.write_config({'b1': 'AutoShareTags', 'b2': 'Recording'})
+
+        self.app.process_due_tasks()
+        self.assertIsInstance(self.app.bots['b2'], fakebot.RecordingBot)
+        # the closed bot is not run again, its tasks are not rescheduled
+        self.assertIsNone(old_bot.status_db)
+        self.assertEqual(self.get_scheduled_identifiers(), {None, 'b1'})
+
+    def test_no_actions_run_after_a_pause(self):
+        self.start_app()
+        runs = []
+
+        def run_bot_task(bot, task):
+            # every task stops on its budget with actions left
+            runs.append((bot.identifier, task.__name__))
+            bot.actions_pending = True
+            return True
+
+        self.app.run_bot_task = run_bot_task
+        self.app.process_due_tasks()
+        # only the scheduled runs, paused tasks get no follow-up run with a fresh budget
+        self.assertCountEqual(runs, [(identifier, task.__name__) for identifier in ('b1', 'b2')
+                                     for task, period in self.app.get_bot(identifier).get_scheduled_tasks()])
+
+    def test_actions_run_after_a_task(self):
+        self.start_app()
+        runs = []
+
+        def run_bot_task(bot, task):
+            runs.append((bot.identifier, task.__name__))
+            bot.actions_pending = task.__name__ != 'process_actions'
+            return False
+
+        self.app.run_bot_task = run_bot_task
+        self.app.process_due_tasks()
+        self.assertEqual(runs[runs.index(('b1', 'run_notifications')) + 1], ('b1', 'process_actions'))
+        # the scheduled run and one after each of the two other tasks
+        self.assertEqual(runs.count(('b1', 'process_actions')), 3)
+
+    def check_bots_kept(self):
+        self.assertIsNone(self.app.check_config(force=True))
+        self.app.reload_bots(force=True)
+        self.assertEqual(list(self.app.bots), ['b1', 'b2'])
+        self.assertEqual(self.app.get_config().get_config().sections(), ['b1', 'b2'])
+
+    def test_missing_config(self):
+        self.start_app()
+        os.remove('config.ini')
+        self.check_bots_kept()
+
+    def test_empty_config(self):
+        self.start_app()
+        open('config.ini', 'w').close()
+        self.check_bots_kept()
+
+    def test_config_without_running_bots(self):
+        self.start_app()
+        self.write_config({'b3': 'AutoShareTags'})
+        self.check_bots_kept()
+
+        self.write_config({'b2': 'AutoShareTags', 'b3': 'AutoShareTags'})
+        self.app.reload_bots(force=True)
+        self.assertEqual(list(self.app.bots), ['b2', 'b3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
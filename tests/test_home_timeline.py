@@ -0,0 +1,129 @@
+# coding=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fakebot  # noqa: E402
+import userstore  # noqa: E402
+
+
+class ConnectedStream:
+    def is_connected(self):
+        return True
+
+    def stop(self):
+        pass
+
+
+class HomeTimelineTest(fakebot.FakeServerTestCase):
+    bot_config = 'HomeMaxPagesPerCycle = 2'
+
+    def restart_bot(self, bot, extra=''):
+        # no final flush, as after a crash
+        bot.status_pending = set()
+        bot.status_db.close()
+        bot.status_db = None
+        self.bots.remove(bot)
+        return self.create_bot(extra)
+
+    def test_no_cursor_starts_from_latest_page(self):
+        ids = self.add_statuses(50)
+        bot = self.create_bot()
+        bot.do_process_home()
+
+        self.assertEqual(bot.statuses, ids[-40:])
+        self.assertEqual(bot.get_status_value('last_home_id'), ids[-1])
+        self.assertNotIn('home', bot.backlog)
+
+    def test_pages_forward_from_cursor(self):
+        ids = self.add_statuses(10)
+        bot = self.create_bot()
+        bot.do_process_home()
+        ids += self.add_statuses(30)
+
+        bot.statuses = []
+        bot.do_process_home()
+        self.assertEqual(bot.statuses, ids[10:])
+        self.assertEqual(bot.get_status_value('home_backfill_count'), 0)
+        self.assertNotIn('home', bot.backlog)
+
+    def test_backfill_pauses_and_resumes_after_restart(self):
+        ids = self.add_statuses(1)
+        bot = self.create_bot()
+        bot.do_process_home()
+        ids += self.add_statuses(100)
+
+        bot.statuses = []
+        bot.do_process_home()
+        self.assertEqual(bot.statuses, ids[1:81])
+        self.assertIn('home', bot.backlog)
+
+        bot = self.restart_bot(bot)
+        bot.do_process_home()
+        self.assertEqual(bot.statuses, ids[81:])
+        self.assertNotIn('home', bot.backlog)
+
+    def test_checkpoint_writes_only_the_cursor(self):
+        self.add_statuses(1)
+        bot = self.create_bot()
+        bot.do_process_home()
+        self.add_statuses(100)
+
+        bot.save_user(userstore.UserRecord('https://remote.example/users/pending', True))
+        bot.save_status_value('other', 'pending')
+        bot.do_process_home()
+
+        self.assertEqual(str(bot.status_db['last_home_id'], 'utf-8'), bot.get_status_value('last_home_id'))
+        self.assertEqual(bot.status_pending, {'other'})
+        self.assertIn('https://remote.example/users/pending', bot.user_store.pending)
+
+    def test_backfill_too_far_skips_gap(self):
+        self.add_statuses(1)
+        bot = self.create_bot('HomeBackfillMaxStatuses = 50')
+        bot.do_process_home()
+        ids = self.add_statuses(200)
+
+        bot.statuses = []
+        bot.do_process_home()
+        self.assertEqual(bot.statuses, ids[:80])
+        self.assertIn('home', bot.backlog)
+
+        # the next run starts again from the latest page
+        bot.statuses = []
+        bot.do_process_home()
+        self.assertEqual(bot.statuses, ids[-40:])
+        self.assertNotIn('home', bot.backlog)
+
+    def test_backfill_goes_on_while_streaming(self):
+        self.add_statuses(1)
+        bot = self.create_bot()
+        bot.do_process_home()
+        ids = self.add_statuses(100)
+        bot.user_stream = ConnectedStream()
+
+        bot.statuses = []
+        bot.do_process_home()
+        self.assertIn('home', bot.backlog)
+
+        # a status streamed while paging is behind waits for the paging to reach it
+        streamed = self.add_status()
+        bot.process_stream_event('update', streamed)
+        self.assertEqual(bot.get_status_value('last_home_id'), ids[79])
+
+        bot.run_home()
+        ids.append(streamed['id'])
+        self.assertEqual(bot.statuses, ids)
+        self.assertEqual(bot.get_status_value('last_home_id'), streamed['id'])
+        self.assertNotIn('home', bot.backlog)
+
+        # caught up, the stream delivers what is new
+        self.add_statuses(1)
+        bot.run_home()
+        self.assertEqual(bot.statuses, ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
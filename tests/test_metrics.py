@@ -0,0 +1,43 @@
+# coding=utf-8
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import metrics  # noqa: E402
+
+
+class HistogramTest(unittest.TestCase):
+    def test_observe_in_buckets(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', buckets=(1, 2))
+        histogram.observe(0.5)
+        histogram.observe(2)
+        self.assertEqual(histogram.get_sums(), {(): (2, 2.5)})
+
+    def test_observe_past_last_bucket(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', buckets=(1, 2))
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(histogram.get_sums(), {(): (2, 5.5)})
+        self.assertEqual(histogram.render(), [
+            '# HELP test_seconds Test',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{le="1"} 1',
+            'test_seconds_bucket{le="2"} 1',
+            'test_seconds_bucket{le="+Inf"} 2',
+            'test_seconds_sum 5.5',
+            'test_seconds_count 2',
+        ])
+
+    def test_labels(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', ('bot',), buckets=(1,))
+        histogram.observe(3, bot='a')
+        histogram.observe(0.5, bot='b')
+        self.assertEqual(histogram.get_sums(), {('a',): (1, 3), ('b',): (1, 0.5)})
+        self.assertEqual(histogram.get_total(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
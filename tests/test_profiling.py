@@ -0,0 +1,61 @@
+# coding=utf-8
+
+import concurrent.futures
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import profiling  # noqa: E402
+
+logger = logging.getLogger('test')
+
+
+def task(value):
+    time.sleep(0.001)
+    return value
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.profiler = profiling.Profiler(logger, self.directory, cycles=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_reports(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.txt'))
+
+    def test_writes_report_after_runs(self):
+        self.profiler.start_cpu(3)
+        for i in range(3):
+            self.assertEqual(self.profiler.run(f'bot{i % 2}', task, i), i)
+
+        self.assertFalse(self.profiler.active)
+        reports = self.get_reports()
+        self.assertEqual(len(reports), 1)
+        with open(os.path.join(self.directory, reports[0]), encoding='utf-8') as f:
+            report = f.read()
+        self.assertIn('Bot bot0', report)
+        self.assertIn('Bot bot1', report)
+
+    def test_concurrent_runs(self):
+        # worker threads of the async loop, tasks overlapping a profiled one run without a profile
+        self.profiler.start_cpu(20)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            while self.profiler.active:
+                results = list(executor.map(lambda i: self.profiler.run(f'bot{i % 4}', task, i), range(50)))
+                self.assertEqual(results, list(range(50)))
+
+        self.assertEqual(len(self.get_reports()), 1)
+        self.assertEqual(self.profiler.bot_stats, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,214 @@
+# coding=utf-8
+
+import http.server
+import io
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import apiclient  # noqa: E402
+import fakebot  # noqa: E402
+import fakemastodon  # noqa: E402
+import streaming  # noqa: E402
+
+
+class StreamServer:
+    # stands in for the streaming api, each connection plays the next script: (status, events, hold open)
+    def __init__(self):
+        self.scripts = queue.Queue()
+        self.connect_times = []
+        self.release = threading.Event()
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server.connect_times.append(time.monotonic())
+                try:
+                    status, events, hold = server.scripts.get_nowait()
+                except queue.Empty:
+                    status, events, hold = 200, [], True
+
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                if status != 200:
+                    return
+
+                self.wfile.write(b':thump\n\n')
+                for event, data in events:
+                    self.wfile.write(f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode('utf-8'))
+                self.wfile.flush()
+                if hold:
+                    server.release.wait(10)
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.release.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class ReadSseEventsTest(unittest.TestCase):
+    def test_events(self):
+        response = io.BytesIO(b':thump\n\n'
+                              b'event: update\ndata: {"id": "1"}\n\n'
+                              b'event: delete\ndata: 2\r\n\r\n'
+                              b'data: first\ndata: second\n\n'
+                              b'event: partial\n')
+        self.assertEqual(list(streaming.read_sse_events(response)),
+                         [('update', {'id': '1'}), ('delete', 2), ('message', 'first\nsecond')])
+
+
+class UserStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StreamServer()
+        api = apiclient.ApiClient(logging.getLogger('test.api'), self.server.get_base_url(), 'test')
+        self.stream = streaming.UserStream(logging.getLogger('test.stream'), api, min_backoff=0.05, max_backoff=0.2)
+
+    def tearDown(self):
+        self.stream.stop()
+        self.server.stop()
+
+    def test_reconnects_with_backoff(self):
+        for _ in range(4):
+            self.server.scripts.put((503, [], False))
+        self.stream.start()
+
+        self.assertTrue(wait_for(lambda: self.stream.is_connected()))
+        self.assertEqual(len(self.server.connect_times), 5)
+        delays = [b - a for a, b in zip(self.server.connect_times, self.server.connect_times[1:])]
+        # 0.05, 0.1, 0.2, then capped at 0.2
+        self.assertGreaterEqual(delays[0], 0.05)
+        self.assertGreaterEqual(delays[1], 0.1)
+        self.assertGreaterEqual(delays[2], 0.2)
+        self.assertLess(delays[3], 0.4)
+
+    def test_events_and_reconnect_after_close(self):
+        self.server.scripts.put((200, [('update', {'id': '1'})], False))
+        self.server.scripts.put((503, [], False))
+        self.server.scripts.put((200, [('update', {'id': '2'})], True))
+        self.stream.start()
+
+        self.assertTrue(wait_for(lambda: len(self.server.connect_times) == 3 and self.stream.is_connected()))
+        self.assertTrue(wait_for(lambda: self.stream.events.qsize() == 5))
+        self.assertEqual(list(self.stream.get_events()), [
+            (streaming.EVENT_CONNECTED, None),
+            ('update', {'id': '1'}),
+            (streaming.EVENT_DISCONNECTED, None),
+            (streaming.EVENT_CONNECTED, None),
+            ('update', {'id': '2'}),
+        ])
+        # a connection that worked resets the backoff
+        self.assertLess(self.server.connect_times[1] - self.server.connect_times[0], 0.1)
+
+
+class BotStreamTest(fakebot.FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = StreamServer()
+        self.bot = self.create_bot(f'''Streaming = true
+StreamingBaseUrl = {self.server.get_base_url()}''')
+
+    def tearDown(self):
+        super().tearDown()
+        self.server.stop()
+
+    def test_backfill_on_connect_and_dedup(self):
+        # the bot already followed the home timeline up to the first status
+        first = self.add_status()
+        self.bot.save_status_value('last_home_id', first['id'])
+        missed_status = self.add_status()
+        missed_mention = self.add_mention()
+
+        new_status = self.add_status()
+        new_mention = self.add_mention()
+        self.server.scripts.put((200, [('notification', missed_mention), ('update', missed_status),
+                                       ('notification', new_mention), ('update', new_status),
+                                       ('notification', new_mention)], True))
+
+        # connected, the script played, then processed at once: the backfill runs before the stream events
+        self.bot.get_user_stream()
+        self.assertTrue(wait_for(lambda: self.bot.user_stream.events.qsize() == 6))
+        self.bot.process_stream()
+
+        self.assertTrue(self.bot.is_stream_connected())
+        # the backfill polls find both mentions and statuses, the stream repeats them
+        self.assertCountEqual(self.bot.notifications, [missed_mention['id'], new_mention['id']])
+        self.assertEqual(self.bot.statuses, [missed_status['id'], new_status['id']])
+        self.assertEqual(self.bot.get_status_value('last_home_id'), new_status['id'])
+
+    def test_stream_while_backfill_is_behind(self):
+        self.bot.close()
+        self.bots.remove(self.bot)
+        self.bot = self.create_bot(f'''Streaming = true
+StreamingBaseUrl = {self.server.get_base_url()}
+NotificationFetchMode = mentions
+CycleRequestBudget = 1''')
+
+        self.bot.save_status_value('last_notification_id', self.add_mention()['id'])
+        ids = self.add_mentions(101)
+        streamed = self.add_mention()
+        ids.append(streamed['id'])
+        self.server.scripts.put((200, [('notification', streamed)], True))
+
+        self.bot.get_user_stream()
+        self.assertTrue(wait_for(lambda: self.bot.user_stream.events.qsize() == 2))
+        # the backfill on connect stops on its budget after one page, then the streamed mention comes
+        self.bot.run_task(self.bot.process_stream)
+        self.assertIn('notifications', self.bot.backlog)
+        self.assertEqual(self.bot.notifications, ids[:40] + [streamed['id']])
+        self.assertEqual(self.bot.get_status_value('last_notification_id'), ids[39])
+
+        for _ in range(10):
+            if 'notifications' not in self.bot.backlog:
+                break
+            self.bot.run_task(self.bot.run_notifications)
+
+        self.assertNotIn('notifications', self.bot.backlog)
+        self.assertCountEqual(self.bot.notifications, ids)
+        self.assertEqual(self.bot.get_status_value('last_notification_id'), streamed['id'])
+
+    def test_stream_events_after_backfill(self):
+        self.bot.save_status_value('last_home_id', self.add_status()['id'])
+        status = self.fake.create_status(fakemastodon.get_user_uri(1), fakemastodon.get_user_account_id(1), 'new')
+        mention = {'id': self.fake.next_id(), 'type': 'mention', 'account': status['account'], 'status': status}
+        self.server.scripts.put((200, [('update', status), ('notification', mention), ('notification', mention)],
+                                 True))
+
+        self.bot.get_user_stream()
+        self.assertTrue(wait_for(lambda: self.bot.user_stream.events.qsize() == 4))
+        self.bot.process_stream()
+
+        self.assertEqual(self.bot.notifications, [mention['id']])
+        self.assertEqual(self.bot.statuses, [status['id']])
+
+
+if __name__ == '__main__':
+    unittest.main()
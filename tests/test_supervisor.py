@@ -0,0 +1,100 @@
+# coding=utf-8
+
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import supervisor  # noqa: E402
+
+logger = logging.getLogger('test')
+logger.setLevel(logging.CRITICAL)
+
+
+def hang():
+    # a worker stuck in a blocking call, its SIGTERM handler never gets to run
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    time.sleep(60)
+
+
+def wait_reload(reloaded):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)  # forked after the supervisor installed its own
+    signal.signal(signal.SIGHUP, lambda signum, frame: reloaded.set())
+    time.sleep(60)
+
+
+class ReloadSupervisor(supervisor.Supervisor):
+    def __init__(self):
+        super().__init__(logger, ['a'], 1)
+        self.reloaded = multiprocessing.Event()
+        self.sent = False
+
+    def start_worker(self, worker):
+        worker.process = multiprocessing.Process(target=wait_reload, args=(self.reloaded,))
+        worker.process.start()
+        worker.start_time = time.time()
+        worker.last_heartbeat = worker.start_time
+
+    def check_workers(self):
+        if not self.sent:
+            time.sleep(0.1)
+            self.sent = True
+            os.kill(os.getpid(), signal.SIGHUP)  # kill -HUP of the supervisor
+            return
+        self.reloaded.wait(5)
+        self.stop_flag = True
+
+
+class ForwardTest(unittest.TestCase):
+    def setUp(self):
+        signums = (signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2)
+        self.handlers = {signum: signal.getsignal(signum) for signum in signums}
+
+    def tearDown(self):
+        for signum, handler in self.handlers.items():
+            signal.signal(signum, handler)
+
+    def test_sighup_is_forwarded_to_workers(self):
+        s = ReloadSupervisor()
+        s.run()
+        self.assertTrue(s.reloaded.is_set())
+        self.assertFalse(s.workers[0].process.is_alive())
+
+
+class HungWorkerTest(unittest.TestCase):
+    def test_hung_worker_is_killed_and_restarted(self):
+        s = supervisor.Supervisor(logger, ['a'], 1, heartbeat_timeout=0, kill_timeout=0.2, min_backoff=60)
+        worker = s.workers[0]
+        worker.process = multiprocessing.Process(target=hang)
+        worker.process.start()
+        process = worker.process
+        try:
+            time.sleep(0.1)
+            s.check_workers()
+            self.assertTrue(worker.terminate_time)
+            time.sleep(0.05)
+            s.check_workers()
+            self.assertTrue(process.is_alive())  # SIGTERM ignored, still within the grace period
+
+            time.sleep(0.3)
+            s.check_workers()
+            process.join(5)
+            self.assertFalse(process.is_alive())
+            self.assertEqual(process.exitcode, -signal.SIGKILL)
+
+            s.check_workers()
+            self.assertIsNone(worker.process)  # restart scheduled after the backoff
+            self.assertGreater(worker.restart_time, time.time())
+        finally:
+            if process.is_alive():
+                process.kill()
+            process.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
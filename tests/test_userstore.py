@@ -0,0 +1,116 @@
+# coding=utf-8
+
+import dbm
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import userstore  # noqa: E402
+
+logger = logging.getLogger('test')
+
+
+class UserStoreSqliteTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dbm_path = os.path.join(self.directory, 'users.db')
+        self.sqlite_path = os.path.join(self.directory, 'users.sqlite3')
+
+        with dbm.open(self.dbm_path, 'c') as db:
+            db['https://a.example/users/a'] = json.dumps({'boost': True, 'hashtags': ['cats']})
+            db['https://a.example/users/b'] = json.dumps({'boost': False, 'use': {'day': '2026-01-01', 'boosts': 3}})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open_store(self):
+        store = userstore.UserStoreSqlite(logger, self.sqlite_path, self.dbm_path)
+        store.open()
+        return store
+
+    def test_migrate_from_dbm(self):
+        store = self.open_store()
+        try:
+            self.assertEqual(store.get_registered_count(), 1)
+            self.assertEqual(store.get('https://a.example/users/a').hashtags, ('cats',))
+            self.assertTrue(store.has('https://a.example/users/b'))
+        finally:
+            store.close()
+
+    def test_legacy_daily_use(self):
+        store = self.open_store()
+        try:
+            self.assertEqual(list(store.iter_daily_use('2026-01-01')),
+                             [('https://a.example/users/b', {'day': '2026-01-01', 'boosts': 3})])
+            self.assertEqual(list(store.iter_daily_use('2026-01-02')), [])
+        finally:
+            store.close()
+
+    def test_store_with_use_day_column(self):
+        db = sqlite3.connect(self.sqlite_path)
+        db.executescript('''
+            CREATE TABLE users (uri TEXT PRIMARY KEY, boost INTEGER NOT NULL DEFAULT 0,
+                                blocked INTEGER NOT NULL DEFAULT 0, use_day TEXT, data TEXT NOT NULL);
+            CREATE INDEX users_use_day ON users (use_day);
+            INSERT INTO users VALUES ('https://a.example/users/c', 1, 0, NULL, '{"boost": true}');
+        ''')
+        db.close()
+
+        store = self.open_store()
+        try:
+            store.save(userstore.UserRecord('https://a.example/users/d', True))
+            store.flush()
+            self.assertEqual(store.get_registered_count(), 2)
+            self.assertEqual(sorted(uri for uri, record in store.iter_registered_users()),
+                             ['https://a.example/users/c', 'https://a.example/users/d'])
+            index = store.db.execute("SELECT name FROM sqlite_master WHERE name = 'users_use_day'").fetchone()
+            self.assertIsNone(index)
+        finally:
+            store.close()
+
+    def test_migrate_once(self):
+        store = self.open_store()
+        record = store.get('https://a.example/users/a')
+        record.boost = False
+        store.save(record)
+        store.close()
+
+        store = self.open_store()
+        try:
+            self.assertEqual(store.get_registered_count(), 0)
+        finally:
+            store.close()
+
+    def test_interrupted_migration_runs_again(self):
+        get_user_row = userstore.get_user_row
+        rows = []
+
+        def interrupt(*args):
+            # the first user is inserted before the failure
+            if rows:
+                raise Exception("Interrupted")
+            rows.append(args)
+            return get_user_row(*args)
+
+        with unittest.mock.patch('userstore.get_user_row', interrupt), self.assertRaises(Exception):
+            self.open_store()
+        self.assertTrue(os.path.exists(self.sqlite_path))
+
+        store = self.open_store()
+        try:
+            self.assertEqual(store.get_registered_count(), 1)
+            self.assertTrue(store.has('https://a.example/users/b'))
+        finally:
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,287 @@
+import dbm
+import json
+import logging
+import sqlite3
+import sys
+
+
+class UserRecord:
+    # kept in memory for every registered user: no per-record dict, uri and hashtags interned
+    __slots__ = ('uri', 'boost', 'blocked', 'hashtags', 'account_id', 'extra')
+
+    def __init__(self, uri, boost=False, blocked=False, hashtags=(), account_id=None, extra=None):
+        self.uri = sys.intern(uri)
+        self.boost = boost
+        self.blocked = blocked
+        self.hashtags = tuple(sys.intern(tag) for tag in hashtags)  # empty = any hashtags
+        self.account_id = account_id  # local instance id, known once registered or seen in the following list
+        self.extra = extra  # unknown keys of the stored record, None when there are none
+
+    def copy(self):
+        record = UserRecord.__new__(UserRecord)
+        record.uri = self.uri
+        record.boost = self.boost
+        record.blocked = self.blocked
+        record.hashtags = self.hashtags
+        record.account_id = self.account_id
+        record.extra = dict(self.extra) if self.extra else None
+        return record
+
+    def to_dict(self):
+        data = dict(self.extra) if self.extra else {}
+        data['boost'] = self.boost
+        if self.blocked:
+            data['blocked'] = True
+        if self.hashtags:
+            data['hashtags'] = list(self.hashtags)
+        if self.account_id:
+            data['account_id'] = self.account_id
+        return data
+
+
+record_keys = ('boost', 'blocked', 'hashtags', 'account_id', 'use')  # daily use moved to the daily counters
+
+
+class UserStoreAbstract:
+    def __init__(self, logger, path):
+        self.logger = logger  # type: logging.Logger
+        self.path = path
+
+        self.registered_count = 0
+        self.pending = {}
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def get(self, uri):
+        # type: (str) -> UserRecord
+        record = self.pending.get(uri)
+        if record is not None:
+            # callers modify the record before saving it, keep the pending one intact
+            return record.copy()
+        return get_user_record(uri, self.read(uri))
+
+    def has(self, uri):
+        return uri in self.pending or bool(self.read(uri))
+
+    def save(self, record):
+        # type: (UserRecord) -> None
+        self.update_registered_count(self.get(record.uri), record)
+        self.pending[record.uri] = record
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        pending = self.pending
+        self.pending = {}
+
+        self.logger.debug(f'Flushing {len(pending)} users')
+        self.write(pending)
+
+    def read(self, uri):
+        return {}
+
+    def write(self, users):
+        pass
+
+    def iter_users(self):
+        return iter(())
+
+    def iter_registered_users(self):
+        for uri, data in self.read_registered_users():
+            if uri not in self.pending:
+                yield uri, get_user_record(uri, data)
+
+        for uri, record in self.pending.items():
+            if record.boost:
+                yield uri, record
+
+    def read_registered_users(self):
+        for uri, data in self.iter_users():
+            if data.get('boost'):
+                yield uri, data
+
+    def iter_daily_use(self, day):
+        # legacy per record counters, read once to seed the daily counters
+        for uri, data in self.iter_users():
+            use = data.get('use')
+            if type(use) == dict and use.get('day') == day:
+                yield uri, use
+
+    def get_registered_count(self):
+        return self.registered_count
+
+    def decode(self, uri, value):
+        data = None
+        try:
+            data = json.loads(value)
+        except json.JSONDecodeError:
+            pass
+
+        if type(data) != dict:
+            self.logger.error(f'Invalid user data {uri}: "{value}", resetting')
+            data = {}
+
+        return data
+
+    def update_registered_count(self, old_record, record):
+        was_registered = bool(old_record.boost)
+        is_registered = bool(record.boost)
+        if is_registered != was_registered:
+            self.registered_count += 1 if is_registered else -1
+
+
+class UserStoreDbm(UserStoreAbstract):
+    def __init__(self, logger, path):
+        super().__init__(logger, path)
+
+        self.db = None
+
+    def open(self):
+        self.db = dbm.open(self.path, 'c')
+        self.registered_count = 0
+
+        self.logger.debug("Counting registered users...")
+
+        count = 0
+        for uri, data in self.iter_users():
+            count += 1
+            if data.get('boost'):
+                self.registered_count += 1
+
+        self.logger.debug(f"Counting done, registered: {self.registered_count} / {count}")
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+    def read(self, uri):
+        v = self.db.get(uri)
+        if v is None:
+            return {}
+        return self.decode(uri, v)
+
+    def write(self, users):
+        for uri, record in users.items():
+            ser_data = json.dumps(record.to_dict())
+            self.logger.debug(f'Saving user data {uri}: {ser_data}')
+            self.db[uri] = ser_data
+
+        if hasattr(self.db, 'sync'):
+            self.db.sync()
+
+    def iter_users(self):
+        for k in self.db.keys():
+            strk = str(k, 'utf-8')
+            yield strk, self.decode(strk, self.db[k])
+
+    def decode(self, uri, value):
+        return super().decode(uri, str(value, 'utf-8'))
+
+
+class UserStoreSqlite(UserStoreAbstract):
+    def __init__(self, logger, path, migrate_path=None):
+        super().__init__(logger, path)
+        self.migrate_path = migrate_path
+
+        self.db = None  # type: sqlite3.Connection | None
+
+    def open(self):
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+
+        # schema and migration commit together, an interrupted migration runs again on the next start
+        self.db.execute('BEGIN')
+        with self.db:
+            created = not self.db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'").fetchone()
+            self.db.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    uri TEXT PRIMARY KEY,
+                    boost INTEGER NOT NULL DEFAULT 0,
+                    blocked INTEGER NOT NULL DEFAULT 0,
+                    data TEXT NOT NULL
+                )
+            ''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS users_boost ON users (boost)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS users_blocked ON users (blocked)')
+            # daily use moved to the daily counters, older stores keep an unused use_day column
+            self.db.execute('DROP INDEX IF EXISTS users_use_day')
+
+            if created and self.migrate_path and dbm.whichdb(self.migrate_path):
+                self.migrate_from_dbm(self.migrate_path)
+
+        self.registered_count = self.db.execute('SELECT COUNT(*) FROM users WHERE boost = 1').fetchone()[0]
+        self.logger.debug(f"Users db opened, registered: {self.registered_count}")
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.db.close()
+            self.db = None
+
+    def read(self, uri):
+        row = self.db.execute('SELECT data FROM users WHERE uri = ?', (uri,)).fetchone()
+        if row is None:
+            return {}
+        return self.decode(uri, row[0])
+
+    def write(self, users):
+        rows = []
+        for uri, record in users.items():
+            data = record.to_dict()
+            ser_data = json.dumps(data)
+            self.logger.debug(f'Saving user data {uri}: {ser_data}')
+            rows.append(get_user_row(uri, data, ser_data))
+
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO users (uri, boost, blocked, data) VALUES (?, ?, ?, ?)',
+                                rows)
+
+    def iter_users(self):
+        for uri, value in self.db.execute('SELECT uri, data FROM users'):
+            yield uri, self.decode(uri, value)
+
+    def read_registered_users(self):
+        for uri, value in self.db.execute('SELECT uri, data FROM users WHERE boost = 1 AND blocked = 0'):
+            yield uri, self.decode(uri, value)
+
+    def migrate_from_dbm(self, dbm_path):
+        self.logger.info(f"Migrating users from {dbm_path}...")
+
+        source = UserStoreDbm(self.logger, dbm_path)
+        source.db = dbm.open(dbm_path, 'r')
+        try:
+            # runs in the transaction of open
+            rows = (get_user_row(uri, data, json.dumps(data)) for uri, data in source.iter_users())
+            self.db.executemany('INSERT OR REPLACE INTO users (uri, boost, blocked, data) VALUES (?, ?, ?, ?)',
+                                rows)
+        finally:
+            source.close()
+
+        count = self.db.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        self.logger.info(f"Migration done, {count} users")
+
+
+def get_user_record(uri, data):
+    # type: (str, dict) -> UserRecord
+    hashtags = data.get('hashtags')
+    if type(hashtags) != list:
+        hashtags = ()
+    account_id = data.get('account_id')
+    if type(account_id) != str:
+        account_id = None
+    extra = {k: v for k, v in data.items() if k not in record_keys} or None
+    return UserRecord(uri, bool(data.get('boost', False)), bool(data.get('blocked', False)),
+                      [tag for tag in hashtags if type(tag) == str], account_id, extra)
+
+
+def get_user_row(uri, data, ser_data):
+    return (uri,
+            1 if data.get('boost') else 0,
+            1 if data.get('blocked') else 0,
+            ser_data)